@@ -1,11 +1,13 @@
 import pyglet
 import logging
 import gc
-import yaml
+import json
 import math
+import os
+import cPickle
+import numpy
 from datetime import timedelta
 from math import floor, ceil
-import os
 
 from pyglet.text import Label
 from sprite.component import SpriteComponent
@@ -13,7 +15,7 @@ from sprite.animation import (
     SpriteAnimation, SpriteAnimationStage, ON_ANIMATION_END
 )
 
-from ascension.util import Singleton
+from ascension.util import Singleton, OrderedSet
 from ascension.settings import AscensionConf as conf
 
 LOG = logging.getLogger(__name__)
@@ -26,13 +28,23 @@ UNIT_GROUP = -10
 SHROUD_GROUP = -15
 OVERLAY_GROUP = -20
 ON_TRANSITION_END = ON_ANIMATION_END
+DEPTH_SPAN = 2 ** 20
+
+
+def get_seconds(time_passed):
+    """ Engines run on float seconds, timedeltas from older callers are converted """
+    if isinstance(time_passed, timedelta):
+        return time_passed.total_seconds()
+    return time_passed
 
 
 class TransitionEngine(object):
+    in_runtime = False
 
     def __init__(self, sprite, remove_after=False, end_callback=None, callbacks={}):
         self.remove_after = remove_after
         self.sprite = sprite
+        self.stopped = False
         for hook, callback_list in callbacks.items():
             for callback in callback_list:
                 self.add_callback(hook, callback)
@@ -62,14 +74,17 @@ class TransitionEngine(object):
     def add_end_callback(self, callback):
         self.add_callback(ON_TRANSITION_END, callback)
 
+    def run_hook(self, hook, extra_time=0.0):
+        for callback in self.callbacks.get(hook, []):
+            try:
+                callback(extra_time)
+            except Exception as e:
+                LOG.exception("Failed to run callback {}:{}".format(callback, e))
+
     def pass_time(self, time_passed):
-        extra_time = self.do_transition(time_passed)
+        extra_time = self.do_transition(get_seconds(time_passed))
         if self.iscomplete():
-            for callback in self.callbacks[ON_ANIMATION_END]:
-                try:
-                    callback(extra_time)
-                except Exception as e:
-                    LOG.exception("Failed to run callback {}:{}".format(callback, e))
+            self.run_hook(ON_TRANSITION_END, extra_time)
 
     def do_transition(self, time_passed):
         raise NotImplementedError()
@@ -77,36 +92,68 @@ class TransitionEngine(object):
     def iscomplete(self):
         raise NotImplementedError()
 
-    def start(self, extra_time=timedelta(0)):
+    def start(self, extra_time=0.0):
         if extra_time:
             self.do_transition(extra_time)
 
+    def stop(self):
+        self.stopped = True
+
+
+class RuntimeEngine(TransitionEngine):
+    """
+    An engine whose state is a row in one of the TransitionRuntime tables, so that it is
+    advanced with every other engine of its kind in one step instead of by the sprite.
+    """
+    in_runtime = True
+    table_name = None
+
+    def __init__(self, sprite, **kwargs):
+        super(RuntimeEngine, self).__init__(sprite, **kwargs)
+        self.row = None
+        self.complete = False
+
+    def start(self, extra_time=0.0):
+        values = self.get_row_values(extra_time)
+        self.row = TransitionRuntime.add_engine(self.table_name, self, **values)
+
+    def get_row_values(self, extra_time):
+        raise NotImplementedError()
 
-class StaticDelay(TransitionEngine):
+    def finish(self, extra_time):
+        self.row = None
+        self.complete = True
+        if not self.stopped:
+            self.run_hook(ON_TRANSITION_END, extra_time)
+
+    def stop(self):
+        super(RuntimeEngine, self).stop()
+        if self.row is not None:
+            TransitionRuntime.remove_engine(self.table_name, self.row)
+            self.row = None
+
+    def iscomplete(self):
+        return self.complete
+
+
+class StaticDelay(RuntimeEngine):
+    table_name = "delays"
 
     def __init__(self, sprite, duration=0, **kwargs):
         super(StaticDelay, self).__init__(sprite, **kwargs)
         self.duration = float(duration)
-        self.delay_remaining = self.duration and timedelta(seconds=self.duration) or False
-
-    def iscomplete(self):
-        return not self.delay_remaining
 
-    def do_transition(self, time_passed):
-        if self.delay_remaining:
-            self.delay_remaining -= time_passed
-            if self.delay_remaining < timedelta(0.0):
-                self.delay_remaining = False
-                return -self.delay_remaining
+    def get_row_values(self, extra_time):
+        return {"remaining": self.duration - extra_time}
 
 
-class MoveEngine(TransitionEngine):
+class MoveEngine(RuntimeEngine):
+    table_name = "moves"
 
     def __init__(self, sprite, destination, speed, **kwargs):
         super(MoveEngine, self).__init__(sprite, **kwargs)
         self.destination = destination
         self.speed = speed
-        self.complete = False
         self.calc_unit_vector()
 
     def calc_unit_vector(self):
@@ -115,35 +162,20 @@ class MoveEngine(TransitionEngine):
         a = dest_x - from_x
         b = dest_y - from_y
         c = (a**2 + b**2)**0.5
-        self.unit_x, self.unit_y = (a/c, b/c)
+        self.distance = c
+        self.unit_x, self.unit_y = c and (a/c, b/c) or (0.0, 0.0)
 
-    def do_transition(self, time_passed):
-        extra_time = timedelta(0)
-        x_diff = time_passed.total_seconds() * self.speed * self.unit_x
-        y_diff = time_passed.total_seconds() * self.speed * self.unit_y
+    def get_row_values(self, extra_time):
         dest_x, dest_y = self.destination
-        x_to_go = abs(dest_x - self.sprite.x)
-        y_to_go = abs(dest_y - self.sprite.y)
-        x_diff_mag = abs(x_diff)
-        y_diff_mag = abs(y_diff)
-        x_overshoot = x_diff_mag - x_to_go
-        y_overshoot = y_diff_mag - y_to_go
-        overshoot = False
-        if self.unit_x and x_overshoot >= 0:
-            extra_time = time_passed.total_seconds() * x_overshoot / x_diff
-            overshoot = True
-        if self.unit_y and y_overshoot >= 0:
-            extra_time = time_passed.total_seconds() * y_overshoot / y_diff
-            overshoot = True
-        if overshoot:
-            self.complete = True
-            self.sprite.set_position(*self.destination)
-        else:
-            self.sprite.set_position(self.sprite.x + x_diff, self.sprite.y + y_diff)
-        return extra_time
-
-    def iscomplete(self):
-        return self.complete
+        remaining = self.distance / float(self.speed) - extra_time
+        vel_x, vel_y = self.speed * self.unit_x, self.speed * self.unit_y
+        if extra_time:
+            left = max(remaining, 0.0)
+            self.sprite.set_position(dest_x - vel_x * left, dest_y - vel_y * left)
+        return {
+            "dest_x": dest_x, "dest_y": dest_y, "vel_x": vel_x, "vel_y": vel_y,
+            "remaining": remaining,
+        }
 
 
 class MoveWithAnimationEngine(MoveEngine):
@@ -154,10 +186,11 @@ class MoveWithAnimationEngine(MoveEngine):
         self.add_end_callback(self.stop_animation)
         self.resting_component = resting_component
 
-    def start(self, extra_time=timedelta(0)):
+    def start(self, extra_time=0.0):
+        super(MoveWithAnimationEngine, self).start(extra_time=extra_time)
         self.restart_animation(extra_time)
 
-    def restart_animation(self, extra_time=timedelta(0)):
+    def restart_animation(self, extra_time=0.0):
         self.sprite.start_animation(
             self.animation, extra_time=extra_time, end_callback=self.restart_animation
         )
@@ -168,7 +201,8 @@ class MoveWithAnimationEngine(MoveEngine):
             self.sprite.set_component(self.resting_component)
 
 
-class FadeEngine(TransitionEngine):
+class FadeEngine(RuntimeEngine):
+    table_name = "fades"
 
     def __init__(self, sprite, start_alpha=None, finish_alpha=0, duration=0,
                  **kwargs):
@@ -177,31 +211,154 @@ class FadeEngine(TransitionEngine):
         self.finish_alpha = finish_alpha
         self.duration = float(duration)
 
-    def start(self, extra_time=timedelta(0)):
+    def get_row_values(self, extra_time):
         if self.duration == 0:
-            self.sprite.set_opacity(self.finish_alpha)
-            return
-        if not self.start_alpha:
+            self.start_alpha = self.finish_alpha
+        elif not self.start_alpha:
             self.start_alpha = self.sprite.opacity
-        else:
-            self.sprite.set_opacity(self.start_alpha)
-        self.continuous_alpha = float(self.start_alpha)
         self.alpha_diff = self.finish_alpha - self.start_alpha
         self.direction = self.alpha_diff > 0 and 1 or -1
-        self.time_alpha_ratio = self.alpha_diff / float(self.duration)
-        super(FadeEngine, self).start(extra_time=extra_time)
-
-    def do_transition(self, time_passed):
-        opacity_change = time_passed.total_seconds() * self.alpha_diff
-        self.continuous_alpha += opacity_change
-        left = self.finish_alpha - self.continuous_alpha
-        if left * self.direction <= 0:
-            self.sprite.set_opacity(self.finish_alpha)
+        # Like the old per-object FadeEngine, the alpha changes by alpha_diff a second
+        alpha = self.start_alpha + extra_time * self.alpha_diff
+        self.sprite.set_opacity(math.floor(alpha))
+        return {
+            "alpha": alpha, "finish": self.finish_alpha, "rate": self.alpha_diff,
+            "direction": self.direction, "opacity": self.sprite.opacity,
+        }
+
+
+class EngineTable(object):
+    """ One row per running engine of a kind, with each column a numpy array """
+
+    def __init__(self, columns, capacity=64):
+        self.columns = columns
+        self.engines = [None] * capacity
+        self.active = numpy.zeros(capacity, dtype=bool)
+        for column in columns:
+            setattr(self, column, numpy.zeros(capacity))
+        self.free_rows = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size - len(self.free_rows)
+
+    def add(self, engine, **values):
+        if self.free_rows:
+            row = self.free_rows.pop()
         else:
-            self.sprite.set_opacity(math.floor(self.continuous_alpha))
+            if self.size == len(self.engines):
+                self.grow()
+            row = self.size
+            self.size += 1
+        for column in self.columns:
+            getattr(self, column)[row] = values.get(column, 0.0)
+        self.active[row] = True
+        self.engines[row] = engine
+        return row
+
+    def remove(self, row):
+        self.active[row] = False
+        self.engines[row] = None
+        self.free_rows.append(row)
+
+    def grow(self):
+        capacity = len(self.engines)
+        self.engines.extend([None] * capacity)
+        self.active = numpy.concatenate([self.active, numpy.zeros(capacity, dtype=bool)])
+        for column in self.columns:
+            values = getattr(self, column)
+            setattr(self, column, numpy.concatenate([values, numpy.zeros(capacity)]))
+
+    def get_active_rows(self):
+        return numpy.flatnonzero(self.active[:self.size])
+
+    def pop_rows(self, rows, extra_times):
+        completed = []
+        for row, extra_time in zip(rows.tolist(), extra_times.tolist()):
+            engine = self.engines[row]
+            engine.row = None
+            completed.append((engine, extra_time))
+            self.remove(row)
+        return completed
+
+
+class TransitionRuntime(object):
+    """
+    Keeps every running move, fade and static delay in EngineTables and advances each table
+    in one vectorized step per tick. End callbacks are only run for the engines that
+    completed, once all of the tables have been stepped.
+    """
+    __metaclass__ = Singleton
 
-    def iscomplete(self):
-        return self.sprite.opacity == self.finish_alpha
+    def __init__(self):
+        self.tables = {
+            "moves": EngineTable(["dest_x", "dest_y", "vel_x", "vel_y", "remaining"]),
+            "fades": EngineTable(["alpha", "finish", "rate", "direction", "opacity"]),
+            "delays": EngineTable(["remaining"]),
+        }
+
+    def add_engine(self, table_name, engine, **values):
+        return self.tables[table_name].add(engine, **values)
+
+    def remove_engine(self, table_name, row):
+        self.tables[table_name].remove(row)
+
+    def get_engine_count(self):
+        return sum([len(table) for table in self.tables.values()])
+
+    def step(self, time_passed):
+        completed = (
+              self.step_moves(self.tables["moves"], time_passed)
+            + self.step_fades(self.tables["fades"], time_passed)
+            + self.step_delays(self.tables["delays"], time_passed)
+        )
+        for engine, extra_time in completed:
+            engine.finish(extra_time)
+
+    def step_moves(self, moves, time_passed):
+        rows = moves.get_active_rows()
+        if not len(rows):
+            return []
+        remaining = moves.remaining[rows] - time_passed
+        moves.remaining[rows] = remaining
+        left = numpy.maximum(remaining, 0.0)
+        x = moves.dest_x[rows] - moves.vel_x[rows] * left
+        y = moves.dest_y[rows] - moves.vel_y[rows] * left
+        engines = moves.engines
+        for row, row_x, row_y in zip(rows.tolist(), x.tolist(), y.tolist()):
+            engines[row].sprite.set_position(row_x, row_y)
+        done = remaining <= 0
+        return moves.pop_rows(rows[done], -remaining[done])
+
+    def step_fades(self, fades, time_passed):
+        rows = fades.get_active_rows()
+        if not len(rows):
+            return []
+        rate = fades.rate[rows]
+        finish = fades.finish[rows]
+        alpha = fades.alpha[rows] + rate * time_passed
+        fades.alpha[rows] = alpha
+        opacity = numpy.floor(alpha)
+        done = ((finish - alpha) * fades.direction[rows] <= 0) | (opacity == finish)
+        opacity[done] = finish[done]
+        changed = opacity != fades.opacity[rows]
+        fades.opacity[rows] = opacity
+        engines = fades.engines
+        for row, row_opacity in zip(rows[changed].tolist(), opacity[changed].tolist()):
+            engines[row].sprite.set_opacity(row_opacity)
+        extra_times = numpy.zeros(done.sum())
+        moving = rate[done] != 0
+        extra_times[moving] = (alpha[done] - finish[done])[moving] / rate[done][moving]
+        return fades.pop_rows(rows[done], numpy.maximum(extra_times, 0.0))
+
+    def step_delays(self, delays, time_passed):
+        rows = delays.get_active_rows()
+        if not len(rows):
+            return []
+        remaining = delays.remaining[rows] - time_passed
+        delays.remaining[rows] = remaining
+        done = remaining <= 0
+        return delays.pop_rows(rows[done], -remaining[done])
 
 
 class AscSpriteComponent(SpriteComponent):
@@ -270,23 +427,23 @@ class AscAnimationPlayer(TransitionEngine):
         self.animation = animation
         self.stage_index = 0
 
-    def start(self, extra_time=timedelta(0)):
+    def start(self, extra_time=0.0):
         self.stage_index = 0
         self.start_next_stage()
         super(AscAnimationPlayer, self).start(extra_time=extra_time)
 
-    def start_next_stage(self, extra_time=timedelta(0)):
+    def start_next_stage(self, extra_time=0.0):
         try:
             self.stage = self.animation.stages[self.stage_index]
         except IndexError:
             return extra_time
         self.stage.update_renderer(self.sprite)
-        self.stage_time_remaining = timedelta(seconds=self.stage.duration)
+        self.stage_time_remaining = self.stage.duration
         return self.do_transition(extra_time)
 
     def do_transition(self, time_passed):
         self.stage_time_remaining -= time_passed
-        if self.stage_time_remaining <= timedelta():
+        if self.stage_time_remaining <= 0:
             self.stage_index += 1
             return self.start_next_stage(extra_time=-self.stage_time_remaining)
 
@@ -301,8 +458,7 @@ class RemoveEngineCallback(object):
         self.engine = engine
 
     def __call__(self, extra_time):
-        if self.engine in self.sprite.transition_engines:
-            self.sprite.transition_engines.remove(self.engine)
+        self.sprite.transition_engines.discard(self.engine)
 
 
 class Callback(object):
@@ -330,19 +486,20 @@ class Callback(object):
 def transition_engine(func):
     def new_func(self, *args, **kwargs):
         static_delay = kwargs.pop("static_delay", 0)
-        extra_time = kwargs.pop("extra_time", timedelta(0))
+        extra_time = get_seconds(kwargs.pop("extra_time", 0.0))
         if static_delay:
             callback = Callback(new_func, self, *args, **kwargs)
             self.static_delay(static_delay, extra_time=extra_time, end_callback=callback)
         else:
             engine = func(self, *args, **kwargs)
-            self.transition_engines.append(engine)
+            self.add_transition_engine(engine)
             engine.start(extra_time=extra_time)
     return new_func
 
 
 class BaseSprite(object):
     instance_count = 0
+    managed = False
 
     def __init__(self, component_name=None, anchor="center"):
         BaseSprite.instance_count += 1
@@ -350,7 +507,7 @@ class BaseSprite(object):
             type(self), component_name, BaseSprite.instance_count
         ))
         self.component = None
-        self.transition_engines = []
+        self.transition_engines = OrderedSet()
         self.animation_player = None
         self.animation = None
         self.displacement_x = 0
@@ -358,6 +515,7 @@ class BaseSprite(object):
         self.anchor = anchor
         self.deleted = False
         self.xyz_updated = True
+        self.rel_x, self.rel_y = 0, 0
         if component_name:
             self.set_component(component_name, anchor=anchor)
 
@@ -367,9 +525,11 @@ class BaseSprite(object):
             type(self), self.component and self.component.name, BaseSprite.instance_count
         ))
 
-    def delete(self, extra_time=timedelta(0)):
+    def delete(self, extra_time=0.0):
         self.deleted = True
-        self.transition_engines = []
+        for engine in self.transition_engines:
+            engine.stop()
+        self.transition_engines = OrderedSet()
         self.animation_player = None
         self.animation = None
 
@@ -400,25 +560,26 @@ class BaseSprite(object):
     def add_subsprite(self, subsprite):
         self.subsprites.append(subsprite)
 
+    def calc_relative_pyglet_xy(self):
+        self.rel_x = (
+            (self.displacement_x - self.anchor_x)
+        )
+        self.rel_y = (
+            (self.displacement_y - self.component_height + self.anchor_y)
+        )
+
     def get_relative_pyglet_xy(self):
-        if self.xyz_updated:
-            self.rel_x = (
-                (self.displacement_x - self.anchor_x)
-            )
-            self.rel_y = (
-                (self.displacement_y - self.component_height + self.anchor_y)
-            )
         return self.rel_x, self.rel_y
 
     def get_component_center(self):
         return self.component_width / 2, self.component_height
 
     def tick(self, time_passed):
-        engines = [eng for eng in self.transition_engines]
+        engines = [eng for eng in self.transition_engines if not eng.in_runtime]
         for engine in engines:
             if engine in self.transition_engines:
                 try:
-                    engine.pass_time(timedelta(seconds=time_passed))
+                    engine.pass_time(time_passed)
                 except Exception:
                     LOG.exception(
                         "Exception encountered in pass_time of engine {}".format(engine)
@@ -469,26 +630,90 @@ class BaseSprite(object):
         elif error_on_no_animation:
             raise KeyError("Sprite {} has no animation to stop".format(self))
 
-    def clear_complete_animation(self, extra_time=timedelta(0)):
+    def clear_complete_animation(self, extra_time=0.0):
         self.animation_player = None
         self.animation = None
 
+    def add_transition_engine(self, engine):
+        self.transition_engines.add(engine)
+        self.activate()
+
+    def mark_xyz_updated(self):
+        self.xyz_updated = True
+        self.activate()
+
+    def activate(self):
+        """ Have the SpriteManager tick this sprite until needs_tick is False again """
+        if self.managed:
+            SpriteManager.active_sprites.add(self)
+
+    def needs_tick(self):
+        if self.xyz_updated:
+            return True
+        for engine in self.transition_engines:
+            if not engine.in_runtime:
+                return True
+        return False
+
+
+class AnimationGroup(object):
+    """
+    The pyglet sprites of a SpriteMaster's followers. A component change that keeps the
+    geometry is written to all of their texture coordinates at once, one numpy assignment per
+    vertex domain, instead of setting the image of every pyglet sprite.
+    """
+
+    def __init__(self, followers):
+        self.followers = followers
+        self.domain_rows = None
+
+    def invalidate(self):
+        self.domain_rows = None
+
+    def get_domain_rows(self):
+        if self.domain_rows is None:
+            vertex_lists = {}
+            for follower in self.followers:
+                if follower.pyglet_sprite:
+                    vertex_list = follower.pyglet_sprite._vertex_list
+                    vertex_lists.setdefault(vertex_list.domain, []).append(vertex_list)
+            self.domain_rows = []
+            for domain, domain_lists in vertex_lists.items():
+                starts = numpy.array([vertex_list.start for vertex_list in domain_lists])
+                rows = starts[:, None] + numpy.arange(domain_lists[0].count)
+                first = rows.min()
+                self.domain_rows.append((domain, first, rows.max() + 1 - first, rows - first))
+        return self.domain_rows
+
+    def write_tex_coords(self, image):
+        tex_coords = numpy.array(image.tex_coords, dtype=numpy.float32)
+        for domain, first, count, rows in self.get_domain_rows():
+            attribute = domain.attribute_names["tex_coords"]
+            region = attribute.get_region(attribute.buffer, first, count)
+            values = numpy.ctypeslib.as_array(region.array).reshape(count, -1)
+            values[rows] = tex_coords.reshape(rows.shape[1], -1)
+            region.invalidate()
+
 
 class SpriteMaster(BaseSprite):
 
     def __init__(self, **kwargs):
-        self.sprite_followers = []
+        self.sprite_followers = OrderedSet()
+        self.animation_group = AnimationGroup(self.sprite_followers)
+        self.geometry = None
         super(SpriteMaster, self).__init__(**kwargs)
 
-    def delete(self, extra_time=timedelta(0)):
+    def delete(self, extra_time=0.0):
         super(SpriteMaster, self).delete(extra_time=extra_time)
-        self.sprite_followers = []
+        self.sprite_followers = OrderedSet()
+        self.animation_group = AnimationGroup(self.sprite_followers)
 
     def add_follower(self, follower):
         if follower in self.sprite_followers:
             raise KeyError("{} already has follower {}".format(self, follower))
         self.set_follower_component(follower)
-        self.sprite_followers.append(follower)
+        self.sprite_followers.add(follower)
+        self.animation_group.invalidate()
 
     def remove_follower(self, follower):
         if follower not in self.sprite_followers:
@@ -496,6 +721,7 @@ class SpriteMaster(BaseSprite):
                 "{} cannot remove follower {} because it doesn't have it".format(self, follower)
             )
         self.sprite_followers.remove(follower)
+        self.animation_group.invalidate()
 
     def set_component(self, component_name=None, component=None, displacement_x=0,
                       displacement_y=0, duration=None, anchor=None):
@@ -512,8 +738,18 @@ class SpriteMaster(BaseSprite):
         self.anchor_x, self.anchor_y = self.component.get_anchor(self.anchor)
         self.displacement_x = displacement_x
         self.displacement_y = displacement_y
-        for follower in self.sprite_followers:
-            self.set_follower_component(follower)
+        geometry = (
+            component.width, component.height, self.anchor_x, self.anchor_y,
+            displacement_x, displacement_y,
+        )
+        if geometry == self.geometry:
+            # Followers keep their positions, only their texture coordinates change. They
+            # pick up the rest of the component when their pyglet sprite is next created.
+            self.animation_group.write_tex_coords(self.image)
+        else:
+            self.geometry = geometry
+            for follower in self.sprite_followers:
+                self.set_follower_component(follower)
 
     def set_follower_component(self, follower):
         follower.set_component(
@@ -524,12 +760,15 @@ class SpriteMaster(BaseSprite):
 
 
 class Sprite(BaseSprite):
+    pool_key = None
 
     def __init__(self, x=0, y=0, z_group=0, parent=None, master=None, opacity=255, **kwargs):
         self.x = floor(x)
         self.y = floor(y)
         self.z_group = z_group
         self.pyglet_sprite = None
+        self.depth = None
+        self.drawn_position = None
         self.visible = True
         self.parent = parent
         self.set_opacity(opacity)
@@ -553,6 +792,39 @@ class Sprite(BaseSprite):
         self.parent = None
         self.subsprites = None
 
+    def release(self):
+        """ Like delete, but hides the pyglet sprite so the SpritePool can hand it out again """
+        super(Sprite, self).delete()
+        if self.pyglet_sprite:
+            self.pyglet_sprite.visible = False
+        if self.master:
+            self.master.remove_follower(self)
+            self.master = None
+        self.parent = None
+        self.subsprites = []
+
+    def recycle(self, x=0, y=0, z_group=0, parent=None, master=None, opacity=255,
+                component_name=None, anchor="center"):
+        """ Reset a released sprite to what __init__ would have made, keeping its pyglet sprite """
+        self.x = floor(x)
+        self.y = floor(y)
+        self.z_group = z_group
+        self.visible = True
+        self.parent = parent
+        self.set_opacity(opacity)
+        if parent:
+            parent.add_subsprite(self)
+        self.subsprites = []
+        self.deleted = False
+        self.displacement_x = 0
+        self.displacement_y = 0
+        self.anchor = anchor
+        self.xyz_updated = True
+        if component_name:
+            self.set_component(component_name, anchor=anchor)
+        if master:
+            self.set_master(master)
+
     def tick(self, time_passed):
         super(Sprite, self).tick(time_passed)
         if self.xyz_updated:
@@ -562,7 +834,7 @@ class Sprite(BaseSprite):
     def set_position(self, x, y):
         self.x = x
         self.y = y
-        self.xyz_updated = True
+        self.mark_xyz_updated()
 
     def set_master(self, master):
         master.add_follower(self)
@@ -602,14 +874,27 @@ class Sprite(BaseSprite):
         self.displacement_y = displacement_y
         if self.pyglet_sprite:
             self.pyglet_sprite.image = self.image
-        self.xyz_updated = True
+        self.calc_relative_pyglet_xy()
+        self.mark_xyz_updated()
 
     def initialize_pyglet_sprite(self):
+        if self.master:
+            self.master.set_follower_component(self)
+            self.master.animation_group.invalidate()
         draw_x, draw_y, draw_z = self.get_pyglet_xyz()
-        self.pyglet_sprite = pyglet.sprite.Sprite(
-            self.image, x=draw_x, y=draw_y, order=draw_z, batch=SpriteManager.batch,
-        )
+        if self.pyglet_sprite:
+            # Recycled by the SpritePool, its vertex list is still in the batch
+            self.pyglet_sprite.x = draw_x
+            self.pyglet_sprite.y = draw_y
+            self.pyglet_sprite.order = draw_z
+            self.pyglet_sprite.visible = True
+        else:
+            self.pyglet_sprite = pyglet.sprite.Sprite(
+                self.image, x=draw_x, y=draw_y, order=draw_z, batch=SpriteManager.batch,
+            )
         self.pyglet_sprite.opacity = self.opacity
+        self.depth = draw_z
+        self.drawn_position = (self.x, self.y)
 
     def update_pyglet_xy(self):
         if self.deleted:
@@ -618,12 +903,66 @@ class Sprite(BaseSprite):
         if draw_x != self.pyglet_sprite.x or draw_y != self.pyglet_sprite.y:
             self.pyglet_sprite.x = draw_x
             self.pyglet_sprite.y = draw_y
-            self.pyglet_sprite.order = draw_z
-        for subsprite in self.subsprites:
-            subsprite.update_pyglet_xy()
+        if draw_z != self.depth:
+            self.depth = draw_z
+            SpriteManager.queue_depth_update(self)
+        if (self.x, self.y) != self.drawn_position:
+            # Subsprites are placed from this sprite's position, not its anchor, so they
+            # only need updating when it moves
+            self.drawn_position = (self.x, self.y)
+            for subsprite in self.subsprites:
+                subsprite.update_pyglet_xy()
 
     def get_pyglet_z(self, x, y):
-        return self.z_group + 0.001 * y + 0.00001 * x
+        """
+        An integer draw order, by z_group, then pixel row, then column. It only changes when
+        the sprite crosses a pixel, so moving sprites are not regrouped on every step.
+        """
+        row = int(floor(y)) + DEPTH_SPAN / 2
+        column = int(floor(x)) + DEPTH_SPAN / 2
+        return (self.z_group * DEPTH_SPAN + row) * DEPTH_SPAN + column
+
+
+class SpritePool(object):
+    """
+    Released Sprites, with their pyglet sprite and its vertex list, kept by z_group and
+    component to be handed out again instead of building new ones.
+    """
+
+    def __init__(self):
+        self.free = {}
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, component_name, z_group=0, **kwargs):
+        key = (z_group, component_name)
+        free = self.free.get(key)
+        if free:
+            self.hits += 1
+            sprite = free.pop()
+            sprite.recycle(component_name=component_name, z_group=z_group, **kwargs)
+        else:
+            self.misses += 1
+            sprite = Sprite(component_name=component_name, z_group=z_group, **kwargs)
+            sprite.pool_key = key
+        return sprite
+
+    def release(self, sprite):
+        sprite.release()
+        self.free.setdefault(sprite.pool_key, []).append(sprite)
+
+    def get_free_count(self):
+        return sum([len(free) for free in self.free.values()])
+
+    def get_hit_rate(self):
+        acquired = self.hits + self.misses
+        return acquired and float(self.hits) / acquired or 0.0
+
+    def clear(self):
+        for free in self.free.values():
+            for sprite in free:
+                sprite.delete()
+        self.free = {}
 
 
 class TextSprite(object):
@@ -665,12 +1004,51 @@ class TextSprite(object):
         self.label.draw()
 
 
+ATLAS_META_CACHE = {}
+
+
+def get_atlas_meta_sidecar(meta_path):
+    return os.path.splitext(meta_path)[0] + ".pickle"
+
+
+def dump_atlas_meta(atlas_meta, meta_path):
+    """ Write the atlas meta as JSON, and as a pickle sidecar that is much faster to load """
+    with open(meta_path, "w") as f:
+        json.dump(atlas_meta, f, indent=4)
+    with open(get_atlas_meta_sidecar(meta_path), "wb") as f:
+        cPickle.dump(atlas_meta, f, cPickle.HIGHEST_PROTOCOL)
+
+
+def load_atlas_meta(meta_path=None):
+    """
+    Load the atlas meta once and share it between everything that needs it. Reads the
+    pickle sidecar when it is at least as new as the JSON, the JSON otherwise.
+    """
+    meta_path = meta_path or conf.atlas_meta
+    if meta_path not in ATLAS_META_CACHE:
+        sidecar_path = get_atlas_meta_sidecar(meta_path)
+        if (
+                os.path.isfile(sidecar_path)
+            and os.path.getmtime(sidecar_path) >= os.path.getmtime(meta_path)
+        ):
+            with open(sidecar_path, "rb") as f:
+                ATLAS_META_CACHE[meta_path] = cPickle.load(f)
+        else:
+            LOG.info("No up to date atlas meta sidecar, loading '{}'".format(meta_path))
+            with open(meta_path) as f:
+                ATLAS_META_CACHE[meta_path] = json.load(f)
+    return ATLAS_META_CACHE[meta_path]
+
+
 class SpriteManager(object):
     __metaclass__ = Singleton
 
     def __init__(self):
         self.load_atlas()
-        self.sprites = []
+        self.sprites = OrderedSet()
+        self.active_sprites = OrderedSet()
+        self.depth_updates = OrderedSet()
+        self.pool = SpritePool()
         self.sprite_sources = []
         self.batch = None
         self.alive = True
@@ -678,18 +1056,14 @@ class SpriteManager(object):
 
     def load_atlas(self):
         self.component_images = {}
-        with open(conf.atlas_meta) as f:
-            atlas_data = yaml.load(f)
-        self.atlas = pyglet.image.atlas.TextureAtlas(4096, 4096)
+        atlas_data = load_atlas_meta()
+        self.atlas = pyglet.image.load(conf.atlas_image).get_texture()
+        self.check_atlas_size(atlas_data["components"])
         self.components = {}
         for component_data in atlas_data["components"]:
             component = AscSpriteComponent.from_meta(component_data)
             self.components[component.name] = component
-            image_name = "{}.png".format(component.name)
-            image_path = os.path.join(conf.img_dir, image_name)
-            image = pyglet.image.load(image_path)
-            texture_region = self.atlas.add(image)
-            self.component_images[component.name] = texture_region
+            self.component_images[component.name] = self.get_atlas_region(component_data)
         self.animations = {}
         for animation_data in atlas_data["animations"]:
             animation = AscAnimation.load(animation_data)
@@ -697,6 +1071,25 @@ class SpriteManager(object):
                 stage.component = self.components[stage.component_name]
             self.animations[animation.name] = animation
 
+    def check_atlas_size(self, components_data):
+        """ Fails clearly when the atlas image was drawn at another scale than sprite_scale """
+        width = max([c["x"] + c["width"] for c in components_data] or [0]) * conf.sprite_scale
+        height = max([c["y"] + c["height"] for c in components_data] or [0]) * conf.sprite_scale
+        if width > self.atlas.width or height > self.atlas.height:
+            raise ValueError(
+                "Atlas image '{}' is {}x{}, too small for the atlas meta at sprite_scale {}"
+                .format(conf.atlas_image, self.atlas.width, self.atlas.height, conf.sprite_scale)
+            )
+
+    def get_atlas_region(self, component_data):
+        # The meta rects are top-down in the unscaled atlas, the texture is the atlas scaled
+        # by sprite_scale with its origin at the bottom
+        width = component_data["width"] * conf.sprite_scale
+        height = component_data["height"] * conf.sprite_scale
+        x = component_data["x"] * conf.sprite_scale
+        y = self.atlas.height - component_data["y"] * conf.sprite_scale - height
+        return self.atlas.get_region(x, y, width, height)
+
     def initialize(self):
         self.batch = pyglet.graphics.Batch()
 
@@ -709,7 +1102,10 @@ class SpriteManager(object):
     def add_sprite(self, sprite):
         if hasattr(sprite, "initialize_pyglet_sprite"):
             sprite.initialize_pyglet_sprite()
-        self.sprites.append(sprite)
+        self.sprites.add(sprite)
+        sprite.managed = True
+        if hasattr(sprite, "needs_tick") and sprite.needs_tick():
+            self.active_sprites.add(sprite)
 
         subsprites = hasattr(sprite, "subsprites") and sprite.subsprites or []
         for subsprite in subsprites:
@@ -717,25 +1113,47 @@ class SpriteManager(object):
 
     def remove_sprite(self, sprite):
         self.sprites.remove(sprite)
+        self.active_sprites.discard(sprite)
+        sprite.managed = False
         subsprites = hasattr(sprite, "subsprites") and sprite.subsprites or []
         for subsprite in subsprites:
             self.remove_sprite(subsprite)
-        sprite.delete()
+        if getattr(sprite, "pool_key", None):
+            self.pool.release(sprite)
+        else:
+            sprite.delete()
+
+    def queue_depth_update(self, sprite):
+        self.depth_updates.add(sprite)
+
+    def apply_depth_updates(self):
+        """ Regroup the pyglet sprites whose draw order changed, once a frame """
+        for sprite in self.depth_updates:
+            if sprite.deleted or not sprite.pyglet_sprite:
+                continue
+            sprite.pyglet_sprite.order = sprite.depth
+            if sprite.master:
+                sprite.master.animation_group.invalidate()
+        self.depth_updates = OrderedSet()
 
     def draw_sprites(self):
         self.batch.draw()
 
     def tick(self, time_passed):
-        for sprite in self.sprites:
+        TransitionRuntime.step(time_passed)
+        for sprite in list(self.active_sprites):
             try:
                 sprite.tick(time_passed)
             except Exception as e:
                 LOG.exception("Failed to tick sprite {}:".format(sprite))
+            if not sprite.needs_tick():
+                self.active_sprites.discard(sprite)
         for source in self.sprite_sources:
             try:
                 self.update_source(source)
             except Exception as e:
                 LOG.exception("Failed to update source {}:".format(source))
+        self.apply_depth_updates()
         if conf.sprite_manager_report_frequency:
             self.next_report_in -= time_passed
             if self.next_report_in <= 0:
@@ -745,6 +1163,14 @@ class SpriteManager(object):
     def do_report(self):
         LOG.info("SPRITE MANAGER REPORT:")
         LOG.info("  sprite instance count: {}".format(BaseSprite.instance_count))
+        LOG.info("  sprite count: {} ({} active)".format(
+            len(self.sprites), len(self.active_sprites)
+        ))
+        LOG.info("  runtime engine count: {}".format(TransitionRuntime.get_engine_count()))
+        LOG.info("  sprite pool hit rate: {:.1%} ({} hits, {} misses, {} free)".format(
+            self.pool.get_hit_rate(), self.pool.hits, self.pool.misses,
+            self.pool.get_free_count()
+        ))
         LOG.info("END SPRITE MANAGER REPORT")
 
     def get_adjusted_position(self, x, y, offset):
@@ -760,8 +1186,8 @@ class SpriteManager(object):
 
     def update_source(self, source):
         LOG.debug("Adding sprites from source '{}'".format(source))
-        new_sprites = list(source.get_new_sprites())
-        for sprite in new_sprites:
+        # Added as they come, so a source timing its own frame budget sees the build cost
+        for sprite in source.get_new_sprites():
             LOG.debug("Adding sprite {}".format(sprite))
             self.add_sprite(sprite)
         LOG.debug("Removing sprites from source '{}'".format(source))
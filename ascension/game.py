@@ -1,4 +1,5 @@
 import logging
+import os
 import pyglet
 import signal
 import sys
@@ -12,7 +13,7 @@ from ascension.window import MainWindowManager
 from ascension.profiler import ProfilerManager
 from ascension.keyboard import KeyboardHandler
 from ascension.mouse import MouseHandler
-from ascension.ascsprite import SpriteManager
+from ascension.ascsprite import SpriteManager, TransitionRuntime
 from ascension.tilemap import TileMap
 from ascension.unit import UnitSet, UnitGroup
 
@@ -40,7 +41,7 @@ def get_game():
 class Ascension(object):
     __metaclass__ = Singleton
     components = [
-        conf, PlayerConf, ProfilerManager, SpriteManager, MainWindowManager,
+        conf, PlayerConf, ProfilerManager, TransitionRuntime, SpriteManager, MainWindowManager,
         KeyboardHandler, MouseHandler, TileMap, UnitSet
     ]
     tick_listeners = [
@@ -73,7 +74,12 @@ class Ascension(object):
     def initialize(self):
         self.setup_signal()
         try:
-            TileMap.generate_map(width=conf.map_width, height=conf.map_height)
+            if conf.map_file and os.path.exists(conf.map_file):
+                TileMap.load(conf.map_file)
+            else:
+                TileMap.generate_map(width=conf.map_width, height=conf.map_height)
+                if conf.map_file:
+                    TileMap.save(conf.map_file)
             unit_group = UnitGroup(0, 0, units=[
                 ("sword", "top_left"),
                 ("spear", "top"),
@@ -14,6 +14,7 @@ class KeyboardHandler(object):
 
     def __init__(self):
         self.keys_held = []
+        self.scroll_velocity = [0.0, 0.0]
 
     def on_key_press(self, symbol, modifiers):
         keystring, modstring = key.symbol_string(symbol), key.modifiers_string(modifiers)
@@ -46,6 +47,7 @@ class KeyboardHandler(object):
         window.push_handlers(self.state)
 
     def tick(self, time_passed):
+        self.scroll_velocity = [0.0, 0.0]
         for symbol in self.keys_held:
             keystring = key.symbol_string(symbol)
             funcname = "tick_{}".format(keystring.lower())
@@ -54,21 +56,29 @@ class KeyboardHandler(object):
                 func(time_passed)
             else:
                 LOG.debug("No tick handler found for held key '{}'('{}')".format(keystring, key))
+        MainWindowManager.set_scroll_velocity(*self.scroll_velocity)
+
+    def scroll(self, time_passed, x, y):
+        self.scroll_velocity[0] += x * PlayerConf.scroll_speed
+        self.scroll_velocity[1] += y * PlayerConf.scroll_speed
+        MainWindowManager.move(
+            x * PlayerConf.scroll_speed * time_passed, y * PlayerConf.scroll_speed * time_passed
+        )
 
     def tick_up(self, time_passed):
-        MainWindowManager.move(0, PlayerConf.scroll_speed * time_passed)
+        self.scroll(time_passed, 0, 1)
         LOG.debug("MainWindowManager 'y' set to '{}'".format(MainWindowManager.y))
 
     def tick_down(self, time_passed):
-        MainWindowManager.move(0, -PlayerConf.scroll_speed * time_passed)
+        self.scroll(time_passed, 0, -1)
         LOG.debug("MainWindowManager 'y' set to '{}'".format(MainWindowManager.y))
 
     def tick_left(self, time_passed):
-        MainWindowManager.move(-PlayerConf.scroll_speed * time_passed, 0)
+        self.scroll(time_passed, -1, 0)
         LOG.debug("MainWindowManager 'x' set to '{}'".format(MainWindowManager.x))
 
     def tick_right(self, time_passed):
-        MainWindowManager.move(PlayerConf.scroll_speed * time_passed, 0)
+        self.scroll(time_passed, 1, 0)
         LOG.debug("MainWindowManager 'x' set to '{}'".format(MainWindowManager.x))
 
     tick_w = tick_up
@@ -0,0 +1,106 @@
+import os
+
+import numpy
+
+
+MAGIC = "ASCMAP"
+VERSION = 1
+HEADER_DTYPE = numpy.dtype([
+    ("magic", "S6"),
+    ("version", "<u2"),
+    ("width", "<i4"),
+    ("height", "<i4"),
+    ("count", "<i4"),
+])
+COLUMNS = [
+    ("terrain", numpy.dtype("u1")),
+    ("locale", numpy.dtype("u1")),
+    ("explored", numpy.dtype("?")),
+    ("edged", numpy.dtype("?")),
+    ("sea_mask", numpy.dtype("u1")),
+    ("sea_border_mask", numpy.dtype("u1")),
+    ("bunch_center_x", numpy.dtype("<i4")),
+    ("bunch_center_y", numpy.dtype("<i4")),
+]
+ALIGNMENT = 8
+
+
+class MapFileError(Exception):
+    pass
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def get_column_offsets(count):
+    """ The byte offset of each column, every one at a fixed place given the tile count """
+    offsets = {}
+    offset = align(HEADER_DTYPE.itemsize)
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        offset = align(offset + dtype.itemsize * count)
+    return offsets, offset
+
+
+class MapFile(object):
+    """
+    A generated map on disk: a fixed header followed by one flat column per tile attribute,
+    memory-mapped so that opening it reads nothing up front and writing a few rows back only
+    touches the pages they are on.
+    """
+
+    def __init__(self, path, mode="r+"):
+        self.path = path
+        header = numpy.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header["magic"][0] != MAGIC:
+            raise MapFileError("'{}' is not a map file".format(path))
+        if header["version"][0] != VERSION:
+            raise MapFileError("Map file '{}' has unsupported version {}".format(
+                path, header["version"][0]
+            ))
+        self.width = int(header["width"][0])
+        self.height = int(header["height"][0])
+        self.count = int(header["count"][0])
+        if self.count != self.width * self.height:
+            raise MapFileError("Map file '{}' has {} tiles for a {}x{} map".format(
+                path, self.count, self.width, self.height
+            ))
+        offsets, size = get_column_offsets(self.count)
+        if os.path.getsize(path) != size:
+            raise MapFileError("Map file '{}' is {} bytes, expected {}".format(
+                path, os.path.getsize(path), size
+            ))
+        self.columns = dict([
+            (name, numpy.memmap(
+                path, dtype=dtype, mode=mode, offset=offsets[name], shape=(self.count,)
+            ))
+            for name, dtype in COLUMNS
+        ])
+
+    @classmethod
+    def write(cls, path, width, height, columns):
+        """
+        Writes a new map file beside path and renames it over path, so a file already there,
+        which may still be memory-mapped, is never truncated
+        """
+        count = width * height
+        _, size = get_column_offsets(count)
+        header = numpy.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"], header["version"] = MAGIC, VERSION
+        header["width"], header["height"], header["count"] = width, height, count
+        temp_path = "{}.tmp".format(path)
+        with open(temp_path, "wb") as f:
+            f.truncate(size)
+            header.tofile(f)
+        map_file = cls(temp_path)
+        for name, column in map_file.columns.items():
+            column[:] = columns[name]
+        map_file.flush()
+        del map_file
+        os.rename(temp_path, path)
+        return cls(path)
+
+    def flush(self, *names):
+        for name in names or self.columns.keys():
+            self.columns[name].flush()
@@ -1,6 +1,12 @@
+import math
 import random
 from decimal import Decimal
 
+import numpy
+
+
+FLOAT_TOLERANCE = 1e-9
+
 
 def smoothstep(a0, a1, w):
     value = w**3 * (w * (w*6 - 15) + 10)
@@ -16,6 +22,19 @@ def normalize(vector):
     return [x / length for x in vector]
 
 
+def normalize_float(vector):
+    length = math.sqrt(sum([x**2 for x in vector]))
+    return [x / length for x in vector]
+
+
+def sum_of_squares(rows):
+    """ sum([x**2 for x in row]) per row. x**2 is pow, which can round differently to x*x """
+    total = numpy.zeros(len(rows))
+    for column in rows.T:
+        total += numpy.power(column, numpy.full(column.shape, 2.0))
+    return total
+
+
 def get_random_vector(num_dimensions):
     """ Based on http://mathworld.wolfram.com/HyperspherePointPicking.html """
     xn = []
@@ -25,6 +44,15 @@ def get_random_vector(num_dimensions):
     return normalize([Decimal(xi * scalar) for xi in xn])
 
 
+def get_random_float_vector(num_dimensions):
+    """ Same random draws and steps as get_random_vector, in float arithmetic """
+    xn = []
+    for _ in range(num_dimensions):
+        xn.append(random.random()*2 - 1)
+    scalar = 1 / math.sqrt(sum([xi**2 for xi in xn]))
+    return normalize_float([xi * scalar for xi in xn])
+
+
 def get_coor_set(dimensions):
     if not dimensions:
         yield []
@@ -52,8 +80,19 @@ def get_bitlist(number, min_digits=0):
 
 
 class TileablePerlinGenerator(object):
+    """
+    Perlin noise that wraps around in every dimension.
+
+    With precision "decimal" the gradient vectors and get_value use Decimal arithmetic in the
+    current decimal context, which reproduces older generated art exactly. With precision
+    "float" the same random draws are made in float arithmetic, so the noise is still
+    deterministic for a seed and is many times faster. The two agree to within
+    FLOAT_TOLERANCE as long as the decimal context keeps at least 16 digits; at lower
+    precisions the rounding of the decimal path itself dominates (about 1e-3 at 5 digits).
+    """
     seed = False
     dimensions = [1, 2, 3]
+    precision = "decimal"
 
     def __init__(self, **kwargs):
         for key, value in kwargs.items():
@@ -63,9 +102,42 @@ class TileablePerlinGenerator(object):
     def generate_vectors(self):
         if self.seed:
             random.seed(self.seed)
-        self.vectors = {}
+        if self.precision == "float":
+            self.generate_float_vectors()
+            return
+        elif self.precision != "decimal":
+            raise ValueError("Unknown perlin precision '{}'".format(self.precision))
+        self._vectors = {}
+        self.vector_array = numpy.zeros(list(self.dimensions) + [len(self.dimensions)])
         for coor in get_coor_set(self.dimensions):
-            self.vectors[tuple(coor)] = get_random_vector(len(self.dimensions))
+            vector = get_random_vector(len(self.dimensions))
+            self._vectors[tuple(coor)] = vector
+            self.vector_array[tuple(coor)] = [float(v) for v in vector]
+
+    def generate_float_vectors(self):
+        """
+        get_random_float_vector for every grid point at once, drawing the same random numbers
+        in the same order as get_coor_set and giving bit for bit the same vectors
+        """
+        count = int(numpy.prod(self.dimensions))
+        num_dimensions = len(self.dimensions)
+        xn = numpy.array([random.random() for _ in xrange(count * num_dimensions)])
+        xn = xn.reshape(count, num_dimensions) * 2 - 1
+        scalar = 1 / numpy.sqrt(sum_of_squares(xn))
+        xn = xn * scalar[:, None]
+        xn = xn / numpy.sqrt(sum_of_squares(xn))[:, None]
+        # get_coor_set varies the first dimension fastest
+        self.vector_array = xn.reshape(list(self.dimensions) + [num_dimensions], order="F")
+        self._vectors = None
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            self._vectors = dict([
+                (coor, self.vector_array[coor].tolist())
+                for coor in numpy.ndindex(*self.dimensions)
+            ])
+        return self._vectors
 
     def get_value(self, *position):
         normalized = [p * d for (p, d) in zip(position, self.dimensions)]
@@ -91,3 +163,39 @@ class TileablePerlinGenerator(object):
 
         value = dot_products[0]
         return value
+
+    def get_values(self, *positions):
+        """
+        Evaluate the noise at many points at once. Takes one array of coordinates per dimension,
+        and returns a float64 array of their broadcast shape. Uses the same seeded vectors and
+        corner ordering as get_value, so the two agree to within float64 rounding.
+        """
+        positions = numpy.broadcast_arrays(
+            *[numpy.asarray(p, dtype=numpy.float64) for p in positions]
+        )
+        normalized = [p * d for (p, d) in zip(positions, self.dimensions)]
+        truncated = [numpy.trunc(n) for n in normalized]
+        anchor_coor = [
+            t.astype(numpy.int64) % d for (t, d) in zip(truncated, self.dimensions)
+        ]
+        dot_products = []
+        for i in range(2**len(self.dimensions)):
+            bitlist = get_bitlist(i, min_digits=len(self.dimensions))
+            overflow_coor = [(a + b) for (a, b) in zip(anchor_coor, bitlist)]
+            coor = tuple([c % d for (c, d) in zip(overflow_coor, self.dimensions)])
+            vectors = self.vector_array[coor]
+            dot_product = numpy.zeros(normalized[0].shape)
+            for k, (n, c) in enumerate(zip(normalized, overflow_coor)):
+                dot_product += (n - c) * vectors[..., k]
+            dot_products.append(dot_product)
+
+        for i in range(len(self.dimensions)):
+            dim_position = normalized[-(i+1)] - truncated[-(i+1)]
+            interpolated = []
+            for i in range(len(dot_products) / 2):
+                left = dot_products[i*2]
+                right = dot_products[i*2 + 1]
+                interpolated.append(smoothstep(left, right, dim_position))
+            dot_products = interpolated
+
+        return dot_products[0]
@@ -7,6 +7,21 @@ import math
 
 
 CONF_FILE_NAME = "ascension_conf.yaml"
+IMG_DIR = "data/img"
+ATLAS_IMAGE_NAME = "ASCENSION_ATLAS.png"
+# The scales make_atlas writes the atlas at
+SPRITE_SCALES = [1, 2, 3]
+
+
+def get_scaled_img_dir(scale, img_dir=IMG_DIR):
+    """ The unscaled images are in img_dir itself, every other scale in its x<scale> folder """
+    if scale not in SPRITE_SCALES:
+        raise ValueError("Unsupported sprite_scale {}, must be one of {}".format(
+            scale, SPRITE_SCALES
+        ))
+    if scale == 1:
+        return img_dir
+    return os.path.join(img_dir, "x{}".format(scale))
 
 
 game_settings = SettingSet([
@@ -41,13 +56,9 @@ game_settings = SettingSet([
         "name": "logging_append",
         "default": {}
     },
-    {
-        "name": "img_dir",
-        "default": "data/img/x3",
-    },
     {
         "name": "atlas_image",
-        "default": "data/img/ASCENSION_ATLAS.png",
+        "default": "",
     },
     {
         "name": "atlas_meta",
@@ -133,9 +144,14 @@ game_settings = SettingSet([
         "parse": float,
     },
     {
-        "name": "tilemap_refresh_stages",
-        "default": 10,
-        "parse": int,
+        "name": "tile_prefetch_time",
+        "default": 0.5,
+        "parse": float,
+    },
+    {
+        "name": "tile_stream_budget",
+        "default": 0.004,
+        "parse": float,
     },
     {
         "name": "unitset_refresh_stages",
@@ -171,6 +187,10 @@ game_settings = SettingSet([
         "default": 28,
         "parse": int,
     },
+    {
+        "name": "map_file",
+        "default": "",
+    },
     {
         "name": "sea_perlin_size_multiplier",
         "default": 4,
@@ -239,6 +259,10 @@ class AscensionConf(SettingBased):
             with open(CONF_FILE_NAME) as f:
                 values = yaml.load(f) or {}
         super(AscensionConf, self).__init__(**values)
+        # The atlas is drawn once per scale, so by default its path follows sprite_scale
+        scaled_img_dir = get_scaled_img_dir(self.sprite_scale)
+        if not self.atlas_image:
+            self.atlas_image = os.path.join(scaled_img_dir, ATLAS_IMAGE_NAME)
 
     @calc_property
     def perspective_sin(self):
@@ -0,0 +1,43 @@
+import numpy
+
+
+class GridIndex(object):
+    """
+    Buckets the rows of a set of fixed points into a grid of cell_width x cell_height cells, so
+    the points inside a rectangle are found by only looking at the cells it overlaps.
+    """
+
+    def __init__(self, x, y, cell_width, cell_height):
+        self.x = numpy.asarray(x)
+        self.y = numpy.asarray(y)
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.cells = {}
+        if not len(self.x):
+            return
+        cell_x = self.x // cell_width
+        cell_y = self.y // cell_height
+        order = numpy.lexsort((cell_y, cell_x))
+        cell_x, cell_y = cell_x[order], cell_y[order]
+        new_cell = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+        starts = numpy.flatnonzero(numpy.concatenate([[True], new_cell]))
+        stops = numpy.append(starts[1:], len(order))
+        for start, stop in zip(starts, stops):
+            self.cells[(int(cell_x[start]), int(cell_y[start]))] = order[start:stop]
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """ Rows of every point with min_x <= x <= max_x and min_y <= y <= max_y, sorted """
+        rows = []
+        for cell_x in range(int(min_x // self.cell_width), int(max_x // self.cell_width) + 1):
+            for cell_y in range(
+                    int(min_y // self.cell_height), int(max_y // self.cell_height) + 1
+                ):
+                cell = self.cells.get((cell_x, cell_y))
+                if cell is not None:
+                    rows.append(cell)
+        if not rows:
+            return numpy.zeros(0, dtype=numpy.intp)
+        rows = numpy.concatenate(rows)
+        x, y = self.x[rows], self.y[rows]
+        inside = (min_x <= x) & (x <= max_x) & (min_y <= y) & (y <= max_y)
+        return numpy.sort(rows[inside])
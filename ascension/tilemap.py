@@ -1,19 +1,19 @@
 import logging
-import math
 import random
-from datetime import timedelta
-from decimal import Decimal
+import time
 
 from Queue import PriorityQueue
-import yaml
+import numpy
 
 from ascension.ascsprite import (
     TILE_GROUP, UNIT_GROUP, Sprite, TextSprite, SpriteManager,
-    SpriteMaster, Callback, TILE_OVERLAY_GROUP, SEA_GROUP
+    SpriteMaster, Callback, TILE_OVERLAY_GROUP, SEA_GROUP, load_atlas_meta
 )
 from ascension.util import Singleton
+from ascension.mapfile import MapFile, COLUMNS as MAP_FILE_COLUMNS
 from ascension.perlin import TileablePerlinGenerator
-from ascension.settings import AscensionConf as conf
+from ascension.spatial import GridIndex
+from ascension.settings import AscensionConf as conf, PlayerConf
 from ascension.window import MainWindowManager
 
 LOG = logging.getLogger(__name__)
@@ -38,7 +38,56 @@ DIRECTIONS = {
     'SE': (1, -1),
 }
 DIRECTIONS_I = dict([(coor, direction) for direction, coor in DIRECTIONS.items()])
-
+NEIGHBOR_DIRECTIONS = ['N', 'NE', 'SE', 'S', 'SW', 'NW']
+NEIGHBOR_INDEX = dict([(direction, i) for i, direction in enumerate(NEIGHBOR_DIRECTIONS)])
+
+
+def get_direction_bits(directions):
+    return sum([1 << NEIGHBOR_INDEX[direction] for direction in directions])
+
+
+# Each shore overlay of a sea tile, with the neighbors that must not be sea and the
+# neighbors that must be sea for it to be drawn
+SHORE_RULES = [
+    ("terrain.features.shore_out_sw", ["N"], ["NW"]),
+    ("terrain.features.shore_out_se", ["N"], ["NE"]),
+    ("terrain.features.shore_out_e", ["SW"], ["S"]),
+    ("terrain.features.shore_out_ne", ["S"], ["SE"]),
+    ("terrain.features.shore_out_nw", ["S"], ["SW"]),
+    ("terrain.features.shore_out_w", ["SE"], ["S"]),
+    ("terrain.features.shore_in_sw", ["S", "SW"], []),
+    ("terrain.features.shore_in_se", ["S", "SE"], []),
+    ("terrain.features.shore_in_e", ["SE", "NE"], []),
+    ("terrain.features.shore_in_ne", ["N", "NE"], []),
+    ("terrain.features.shore_in_w", ["SW", "NW"], []),
+    ("terrain.features.shore_in_nw", ["NW", "N"], []),
+]
+SHORE_OVERLAYS = [
+    tuple([
+        name for name, land, sea in SHORE_RULES
+        if not sea_mask & get_direction_bits(land)
+        and sea_mask & get_direction_bits(sea) == get_direction_bits(sea)
+    ])
+    for sea_mask in range(2 ** len(NEIGHBOR_DIRECTIONS))
+]
+SEA_BORDERS = [
+    ('S', "terrain.features.sea_border_s"),
+    ('SW', "terrain.features.sea_border_sw"),
+    ('NW', "terrain.features.sea_border_nw"),
+]
+SEA_BORDER_OVERLAYS = [
+    tuple([
+        name for direction, name in SEA_BORDERS
+        if border_mask & get_direction_bits([direction])
+    ])
+    for border_mask in range(2 ** len(NEIGHBOR_DIRECTIONS))
+]
+TERRAINS = ["plains", "sea", "forest", "mountain"]
+TERRAIN_CODES = dict([(terrain, code) for code, terrain in enumerate(TERRAINS)])
+COOR_KEY_SPAN = 2 ** 24
+COOR_KEY_OFFSET = 2 ** 23
+LOCALES = [None, "village"]
+LOCALE_CODES = dict([(locale, code) for code, locale in enumerate(LOCALES)])
 
 
 def get_tile_bunch_center(x, y):
@@ -56,36 +105,55 @@ class TileMap(object):
     tile_width = 71
     tile_height = 30
     horz_point_width = 16
+    view_cell_tiles = 4
 
     def __init__(self):
         self.moverules = SimpleHexMoveRules()
         self.reset_tiles()
-        self.load_feature_maps()
-        self.new_refresh_stage = 0
-        self.remove_refresh_stage = 0
+        self.feature_maps = None
 
     def load_feature_maps(self):
         self.feature_maps = {}
-        with open(conf.atlas_meta) as f:
-            atlas_data = yaml.load(f)
+        atlas_data = load_atlas_meta()
         for name, feature_map_data in atlas_data['feature_maps'].items():
             feature_map = FeatureMap()
             feature_map.__setstate__(feature_map_data)
             self.feature_maps[name] = feature_map
 
     def reset_tiles(self):
-        self.tile_map = {}
-        self.tiles = []
+        self.store = TileStore(0)
+        self.tiles = TileList(self.store)
+        self.map_file = None
+        self.exploration_rows = set()
         self.count = 0
+        self.width, self.height = 0, 0
+        self.min_x, self.max_x = 0, 0
+        self.column_y_start = []
+        self.spatial_index = GridIndex([], [], 1, 1)
+        self.rows_in_view = set()
+        self.rows_entered_view = []
+        self.rows_left_view = []
+        self.pending_rows = set()
+        self.changed_rows = set()
+        self.refresh_rows = set()
+        self.view_rect = (0, 0, 0, 0)
+        self.view_rects = None
 
     def generate_map(self, width, height, seed=111):
-        if width % 14 or height % 14:
-            raise Exception("Map width and height must be multiples of 14")
+        self.check_map_size(width, height)
         random.seed(seed)
         self.create_sprite_masters()
         self.generate_square(width=width, height=height)
         self.determine_outer_limits()
         self.assign_terrain()
+        self.calc_overlay_masks()
+        self.setup_visibility()
+
+    def check_map_size(self, width, height):
+        if width % 14 or height % 14:
+            raise Exception("Map width and height must be multiples of 14")
+
+    def setup_visibility(self):
         if conf.reveal_map:
             self.reveal_map()
         else:
@@ -100,10 +168,59 @@ class TileMap(object):
                     edged_tile = self.gettile(x+i, y+j)
                     edged_tile.edged = True
 
+    def load(self, path):
+        self.create_sprite_masters()
+        self.load_tiles(path)
+
+    def load_tiles(self, path):
+        """ Builds the map saved to path, keeping the file open to save exploration into """
+        map_file = MapFile(path)
+        self.generate_square(width=map_file.width, height=map_file.height)
+        for name, _ in MAP_FILE_COLUMNS:
+            getattr(self.store, name)[:] = map_file.columns[name]
+        self.determine_outer_limits()
+        self.map_file = map_file
+        if conf.reveal_map:
+            self.reveal_map()
+
+    def save(self, path):
+        self.map_file = None
+        self.map_file = MapFile.write(path, self.width, self.height, dict([
+            (name, getattr(self.store, name)) for name, _ in MAP_FILE_COLUMNS
+        ]))
+        self.exploration_rows = set()
+
+    def record_exploration(self, tile):
+        self.exploration_rows.add(tile.row)
+
+    def write_exploration(self):
+        """
+        Copies the rows explored or edged since the last write into the mapped map file. The
+        pages reach the disk whenever the OS writes them back, or on save_exploration.
+        """
+        if not self.map_file or not self.exploration_rows:
+            return
+        rows = numpy.array(sorted(self.exploration_rows), dtype=numpy.intp)
+        for name in ("explored", "edged"):
+            self.map_file.columns[name][rows] = getattr(self.store, name)[rows]
+        self.exploration_rows = set()
+
+    def save_exploration(self):
+        if not self.map_file:
+            return
+        self.write_exploration()
+        self.map_file.flush("explored", "edged")
+
+    def quit(self):
+        self.save_exploration()
+
+    def alive(self):
+        return False
+
     def reveal_map(self):
-        for tile in self.tiles:
-            tile.edged = True
-            tile.explored = True
+        self.store.edged[:] = True
+        self.store.explored[:] = True
+        self.changed_rows.update(self.rows_in_view)
 
     def create_sprite_masters(self):
         self.sea_sprite_masters = []
@@ -121,51 +238,78 @@ class TileMap(object):
             SpriteManager.add_sprite(sprite_master)
 
     def generate_square(self, width=14, height=14):
+        self.reset_tiles()
         self.width, self.height = width, height
         self.min_x = -(self.width - 1) / 2
         self.max_x = (self.width + 1)/ 2
         self.min_y = -(self.height - 1) / 2
         self.max_y = (self.height + 1)/ 2
-        for x in range(self.min_x, self.max_x):
-            y_offset = -int(math.ceil(x / 2.0))
-            for y in range(self.min_y + y_offset, self.max_y + y_offset):
-                x_pos, y_pos = self.get_tile_pos(x, y)
-                terrain = x % 2 and "sea" or "plains"
-                tile = Tile(x, y, x_pos=x_pos, y_pos=y_pos, terrain=terrain)
-                self.addtile(tile)
+        columns = numpy.arange(self.min_x, self.max_x)
+        column_y_start = self.min_y + (-columns) // 2
+        self.column_y_start = column_y_start.tolist()
+
+        store = TileStore(self.width * self.height)
+        store.x[:] = numpy.repeat(columns, self.height)
+        store.y[:] = (
+              numpy.repeat(column_y_start, self.height)
+            + numpy.tile(numpy.arange(self.height), self.width)
+        )
+        store.x_pos[:] = store.x * (self.tile_width - self.horz_point_width)
+        store.y_pos[:] = store.y * self.tile_height + store.x * self.get_vert_x_shift()
+        store.terrain[:] = numpy.where(
+            store.x % 2, TERRAIN_CODES["sea"], TERRAIN_CODES["plains"]
+        )
+        orientation = (store.x + 5*store.y) % 7
+        translations = numpy.array([BUNCH_TRANSLATIONS[i] for i in range(7)])
+        store.bunch_center_x[:] = store.x + translations[orientation, 0]
+        store.bunch_center_y[:] = store.y + translations[orientation, 1]
+
+        self.store = store
+        self.tiles = TileList(store)
+        self.count = store.count
+        self.spatial_index = GridIndex(
+            store.x_pos, store.y_pos, self.tile_width * self.view_cell_tiles,
+            self.tile_height * self.view_cell_tiles,
+        )
+        for i, direction in enumerate(NEIGHBOR_DIRECTIONS):
+            xd, yd = DIRECTIONS[direction]
+            store.neighbors[:, i] = self.get_rows(store.x + xd, store.y + yd)
 
     def determine_outer_limits(self):
         self.max_x_pos, self.min_x_pos = 0, 0
         self.max_y_pos, self.min_y_pos = 0, 0
-        for tile in self.tiles:
-            self.max_x_pos = tile.x_pos > self.max_x_pos and tile.x_pos or self.max_x_pos
-            self.min_x_pos = tile.x_pos < self.min_x_pos and tile.x_pos or self.min_x_pos
-            self.max_y_pos = tile.y_pos > self.max_y_pos and tile.y_pos or self.max_y_pos
-            self.min_y_pos = tile.y_pos < self.min_y_pos and tile.y_pos or self.min_y_pos
+        if self.count:
+            self.max_x_pos = max(self.max_x_pos, int(self.store.x_pos.max()))
+            self.min_x_pos = min(self.min_x_pos, int(self.store.x_pos.min()))
+            self.max_y_pos = max(self.max_y_pos, int(self.store.y_pos.max()))
+            self.min_y_pos = min(self.min_y_pos, int(self.store.y_pos.min()))
 
     def get_feature_map(self, name):
+        if self.feature_maps is None:
+            self.load_feature_maps()
         return self.feature_maps[name]
 
     def assign_terrain(self):
-        self.tiles_left = list(self.tiles)
         self.assign_sea()
         self.assign_mountains()
         self.assign_forests()
         self.assign_village()
 
     def assign_terrain_perlin(self, terrain, percentage_of_remaining, size_multiplier):
-        tile_count = int(len(self.tiles_left) * percentage_of_remaining)
+        rows = numpy.flatnonzero(self.unassigned)
+        tile_count = int(len(rows) * percentage_of_remaining)
         perlin_width = size_multiplier * self.width / 14
         perlin_height = size_multiplier * self.height / 14
-        perlin = TileablePerlinGenerator(dimensions=[perlin_width, perlin_height])
-        values_list = []
-        for tile in self.tiles_left:
-            perlin_value = self.get_map_perlin_value(perlin, tile.x_pos, tile.y_pos)
-            values_list.append((perlin_value, tile))
-        tile_queue = [x[1] for x in sorted(values_list)[:tile_count]]
-        for tile in tile_queue:
-            tile.terrain = terrain
-            self.tiles_left.remove(tile)
+        perlin = TileablePerlinGenerator(
+            dimensions=[perlin_width, perlin_height], precision="float"
+        )
+        perlin_values = self.get_map_perlin_values(
+            perlin, self.store.x_pos[rows], self.store.y_pos[rows]
+        )
+        if tile_count < len(rows):
+            rows = rows[numpy.argpartition(perlin_values, tile_count)[:tile_count]]
+        self.store.terrain[rows] = TERRAIN_CODES[terrain]
+        self.unassigned[rows] = False
 
     def assign_mountains(self):
         self.assign_terrain_perlin(
@@ -177,12 +321,12 @@ class TileMap(object):
             "forest", conf.forest_percentage, conf.forest_perlin_size_multiplier
         )
 
-    def get_map_perlin_value(self, perlin, x_pos, y_pos):
+    def get_map_perlin_values(self, perlin, x_pos, y_pos):
         if not hasattr(self, "top_edge"):
             self.generate_map_perlin_helper_values()
-        perlin_x = (x_pos - self.left_edge) / Decimal(self.frame_width)
-        perlin_y = (y_pos - self.bottom_edge) / Decimal(self.frame_height)
-        return perlin.get_value(perlin_x, perlin_y)
+        perlin_x = (x_pos - self.left_edge) / float(self.frame_width)
+        perlin_y = (y_pos - self.bottom_edge) / float(self.frame_height)
+        return perlin.get_values(perlin_x, perlin_y)
 
     def generate_map_perlin_helper_values(self):
         self.top_edge = self.max_y_pos
@@ -195,63 +339,110 @@ class TileMap(object):
     def assign_sea(self):
         perlin_width = conf.sea_perlin_size_multiplier * self.width / 14
         perlin_height = conf.sea_perlin_size_multiplier * self.height / 14
-        sea_perlin = TileablePerlinGenerator(dimensions=[perlin_width, perlin_height])
-        bunch_values = {}
-        for tile in self.tiles_left:
-            bunch = get_tile_bunch_center(tile.x, tile.y)
-            bunch_tile = self.gettile(*bunch)
-            if bunch_tile and bunch not in bunch_values:
-                perlin_value = self.get_map_perlin_value(sea_perlin, bunch_tile.x_pos, bunch_tile.y_pos)
-                bunch_values[bunch] = perlin_value
-        ordered_bunches = sorted([(j, i) for i, j in bunch_values.items()])
-        bunch_terrains = {}
+        sea_perlin = TileablePerlinGenerator(
+            dimensions=[perlin_width, perlin_height], precision="float"
+        )
+        store = self.store
+        bunch_keys = numpy.unique(self.get_coor_keys(store.bunch_center_x, store.bunch_center_y))
+        bunch_x, bunch_y = self.get_key_coors(bunch_keys)
+        bunch_rows = self.get_rows(bunch_x, bunch_y)
+        on_map = bunch_rows >= 0
+        bunch_keys, bunch_x, bunch_y = bunch_keys[on_map], bunch_x[on_map], bunch_y[on_map]
+        bunch_rows = bunch_rows[on_map]
+        perlin_values = self.get_map_perlin_values(
+            sea_perlin, store.x_pos[bunch_rows], store.y_pos[bunch_rows]
+        )
+        # Lowest values first, ties broken by bunch coordinates
+        ordered_bunches = numpy.lexsort((bunch_y, bunch_x, perlin_values))
         midpoint = int(len(ordered_bunches) * conf.sea_percentage)
-        for _, bunch in ordered_bunches[:midpoint]:
-            bunch_terrains[bunch] = "sea"
-        for _, bunch in ordered_bunches[midpoint:]:
-            bunch_terrains[bunch] = "plains"
-        for tile in self.tiles:
-            bunch = get_tile_bunch_center(tile.x, tile.y)
-            bunch = self.get_wrapped_coor(*bunch)
-            tile.terrain = bunch and bunch_terrains[bunch] or 'sea'
-            if tile.terrain == 'sea':
-                self.tiles_left.remove(tile)
+        sea_bunches = numpy.zeros(len(bunch_keys), dtype=numpy.bool_)
+        sea_bunches[ordered_bunches[:midpoint]] = True
+
+        # Every tile takes the terrain of its bunch center, wrapped onto the map, and is sea
+        # when that center is off the map
+        center_rows = self.get_rows(store.bunch_center_x, store.bunch_center_y)
+        on_map = center_rows >= 0
+        center_keys = self.get_coor_keys(store.x[center_rows], store.y[center_rows])
+        bunches = numpy.searchsorted(bunch_keys, center_keys).clip(0, len(bunch_keys) - 1)
+        is_sea = ~on_map | sea_bunches[bunches]
+        store.terrain[:] = numpy.where(is_sea, TERRAIN_CODES["sea"], TERRAIN_CODES["plains"])
+        # Sea is the first pass and sets every tile, so it starts the mask of tiles left to assign
+        self.unassigned = ~is_sea
+
+    def get_coor_keys(self, x, y):
+        """ One sortable int64 per coordinate pair, ordered by x then y """
+        return (x.astype(numpy.int64) + COOR_KEY_OFFSET) * COOR_KEY_SPAN + y + COOR_KEY_OFFSET
+
+    def get_key_coors(self, keys):
+        return keys // COOR_KEY_SPAN - COOR_KEY_OFFSET, keys % COOR_KEY_SPAN - COOR_KEY_OFFSET
 
     def assign_village(self):
         for tile in [(-2, 5)]:
             self.gettile(*tile).locale = "village"
 
-    def addtile(self, tile):
-        if tile.x not in self.tile_map:
-            self.tile_map[tile.x] = {}
-        elif tile.y in self.tile_map[tile.x]:
-            raise KeyError(
-                "TileMap already contains a tile for point ({}, {})"
-                .format(tile.x, tile.y)
-            )
-        self.tile_map[tile.x][tile.y] = tile
-        self.tiles.append(tile)
-        self.count += 1
-
-    def get_wrapped_coor(self, x, y):
-        if x not in self.tile_map:
+    def get_row(self, x, y):
+        if not self.min_x <= x < self.max_x:
+            if not self.width:
+                return None
             halfwidth = self.width / 2
             y += ((x + halfwidth) / self.width) * halfwidth
             x = (x + halfwidth) % self.width - halfwidth
-            return self.get_wrapped_coor(x, y)
-        elif y not in self.tile_map[x]:
+        column = x - self.min_x
+        offset = y - self.column_y_start[column]
+        if 0 <= offset < self.height:
+            return column * self.height + offset
+        return None
+
+    def get_rows(self, x, y):
+        """ get_row for arrays of coordinates, with -1 where there is no tile """
+        halfwidth = self.width / 2
+        y = y + ((x + halfwidth) // self.width) * halfwidth
+        x = (x + halfwidth) % self.width - halfwidth
+        column = x - self.min_x
+        offset = y - numpy.asarray(self.column_y_start, dtype=numpy.int64)[column]
+        return numpy.where(
+            (0 <= offset) & (offset < self.height), column * self.height + offset, -1
+        )
+
+    def calc_overlay_masks(self):
+        """
+        Bit i of a tile's sea_mask is set when its neighbor in NEIGHBOR_DIRECTIONS[i] is sea,
+        and of its sea_border_mask when that sea neighbor is in another tile bunch. They
+        index SHORE_OVERLAYS and SEA_BORDER_OVERLAYS.
+        """
+        store = self.store
+        neighbors = store.neighbors
+        neighbor_sea = (neighbors >= 0) & (store.terrain == TERRAIN_CODES["sea"])[neighbors]
+        other_bunch = (
+              (store.bunch_center_x[neighbors] != store.bunch_center_x[:, None])
+            | (store.bunch_center_y[neighbors] != store.bunch_center_y[:, None])
+        )
+        bits = 1 << numpy.arange(len(NEIGHBOR_DIRECTIONS))
+        store.sea_mask[:] = (neighbor_sea * bits).sum(axis=1)
+        store.sea_border_mask[:] = ((neighbor_sea & other_bunch) * bits).sum(axis=1)
+
+    def get_similar_terrain_mask(self):
+        """ For each tile and NEIGHBOR_DIRECTIONS, whether that neighbor has the same terrain """
+        neighbors = self.store.neighbors
+        terrain = self.store.terrain
+        return (neighbors >= 0) & (terrain[neighbors] == terrain[:, None])
+
+    def get_wrapped_coor(self, x, y):
+        row = self.get_row(x, y)
+        if row is None:
             return None
-        return x, y
+        return int(self.store.x[row]), int(self.store.y[row])
 
     def gettile(self, x, y):
-        coor = self.get_wrapped_coor(x, y)
-        if coor:
-            x, y = coor
-            return self.tile_map[x][y]
-        return None
+        row = self.get_row(x, y)
+        if row is None:
+            return None
+        return self.tiles[row]
 
     def hastile(self, x, y):
-        return x in self.tile_map and y in self.tile_map[x]
+        if not self.min_x <= x < self.max_x:
+            return False
+        return 0 <= y - self.column_y_start[x - self.min_x] < self.height
 
     def get_vert_x_shift(self):
         return conf.tile_height / 2
@@ -311,51 +502,232 @@ class TileMap(object):
         for e in to_edge:
             tile = self.gettile(*e)
             tile.edge()
+        self.write_exploration()
+
+    def get_view_rects(self):
+        """
+        The rect on screen, the rect to have tiles ready in, which reaches tile_prefetch_time
+        of scrolling ahead of the screen, and the rect tiles are kept in. The last reaches as
+        far on every side so prefetched tiles are not dropped when the scroll stops or turns.
+        """
+        view_rect = MainWindowManager.get_view_rect(conf.tile_width * 1.5, conf.tile_height * 3.0)
+        min_x, min_y, max_x, max_y = view_rect
+        velocity_x, velocity_y = MainWindowManager.scroll_velocity
+        ahead_x = velocity_x * conf.tile_prefetch_time
+        ahead_y = velocity_y * conf.tile_prefetch_time
+        load_rect = (
+            min_x + min(ahead_x, 0), min_y + min(ahead_y, 0),
+            max_x + max(ahead_x, 0), max_y + max(ahead_y, 0),
+        )
+        margin = max(PlayerConf.scroll_speed * conf.tile_prefetch_time, abs(ahead_x), abs(ahead_y))
+        keep_rect = (min_x - margin, min_y - margin, max_x + margin, max_y + margin)
+        return view_rect, load_rect, keep_rect
+
+    def update_view(self, view_rect, load_rect=None, keep_rect=None):
+        """
+        Find the tiles inside load_rect, plus the ones already in view that are still inside
+        keep_rect, with the spatial index. Keeps which tiles came into view and which went
+        out of view since the last update, and queues the new ones to be built. Nothing is
+        queried while the rects stay where they were on the last update.
+        """
+        load_rect = load_rect or view_rect
+        keep_rect = keep_rect or load_rect
+        if (view_rect, load_rect, keep_rect) == self.view_rects:
+            self.rows_entered_view, self.rows_left_view = [], []
+            return
+        self.view_rects = (view_rect, load_rect, keep_rect)
+        rows_in_view = self.rows_in_view.intersection(
+            self.spatial_index.query(*keep_rect).tolist()
+        )
+        rows_in_view.update(self.spatial_index.query(*load_rect).tolist())
+        self.rows_entered_view = sorted(rows_in_view - self.rows_in_view)
+        self.rows_left_view = sorted(self.rows_in_view - rows_in_view)
+        self.rows_in_view = rows_in_view
+        self.view_rect = view_rect
+        for row in self.rows_entered_view:
+            self.tiles[row].is_in_view = True
+        for row in self.rows_left_view:
+            self.tiles[row].is_in_view = False
+        self.pending_rows.update(self.rows_entered_view)
+        self.pending_rows.difference_update(self.rows_left_view)
+
+    def get_rows_to_build(self, budget):
+        """
+        Pending rows inside view_rect, which are always built, then the prefetched ones,
+        nearest to the screen first, until budget seconds of this frame are used up
+        """
+        start = time.time()
+        rows = numpy.array(sorted(self.pending_rows), dtype=numpy.intp)
+        min_x, min_y, max_x, max_y = self.view_rect
+        x_pos, y_pos = self.store.x_pos[rows], self.store.y_pos[rows]
+        on_screen = (min_x <= x_pos) & (x_pos <= max_x) & (min_y <= y_pos) & (y_pos <= max_y)
+        for row in rows[on_screen].tolist():
+            yield row
+        prefetch_rows = rows[~on_screen]
+        distance = (
+              (x_pos[~on_screen] - (min_x + max_x) / 2.0)**2
+            + (y_pos[~on_screen] - (min_y + max_y) / 2.0)**2
+        )
+        for row in prefetch_rows[numpy.argsort(distance, kind="mergesort")].tolist():
+            if time.time() - start > budget:
+                return
+            yield row
+
+    def refresh_tile(self, tile):
+        if tile.is_in_view:
+            self.changed_rows.add(tile.row)
 
     def get_new_sprites(self):
-        for i in range(self.new_refresh_stage, len(self.tiles), conf.tilemap_refresh_stages):
-            tile = self.tiles[i]
-            for sprite in tile.get_new_sprites():
+        self.update_view(*self.get_view_rects())
+        self.refresh_rows, self.changed_rows = self.changed_rows, set()
+        for row in sorted(self.refresh_rows):
+            for sprite in self.tiles[row].get_new_sprites():
+                yield sprite
+        for row in self.get_rows_to_build(conf.tile_stream_budget):
+            self.pending_rows.discard(row)
+            for sprite in self.tiles[row].get_new_sprites():
                 yield sprite
-        self.new_refresh_stage = (self.new_refresh_stage + 1) % conf.tilemap_refresh_stages
 
     def get_sprites_to_remove(self):
-        for i in range(self.remove_refresh_stage, len(self.tiles), conf.tilemap_refresh_stages):
-            tile = self.tiles[i]
-            for sprite in tile.get_sprites_to_remove():
+        for row in sorted(self.refresh_rows.union(self.rows_left_view)):
+            for sprite in self.tiles[row].get_sprites_to_remove():
                 yield sprite
-        self.remove_refresh_stage = (self.remove_refresh_stage + 1) % conf.tilemap_refresh_stages
+        self.refresh_rows = set()
 
 
-class Tile(object):
+class TileStore(object):
+    """
+    Column storage for the tiles of a map. Each tile is one row, and every attribute that is
+    fixed by map generation lives in a flat numpy column instead of on a per tile object.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.x = numpy.zeros(count, dtype=numpy.int32)
+        self.y = numpy.zeros(count, dtype=numpy.int32)
+        self.x_pos = numpy.zeros(count, dtype=numpy.int32)
+        self.y_pos = numpy.zeros(count, dtype=numpy.int32)
+        self.terrain = numpy.zeros(count, dtype=numpy.uint8)
+        self.locale = numpy.zeros(count, dtype=numpy.uint8)
+        self.explored = numpy.zeros(count, dtype=numpy.bool_)
+        self.edged = numpy.zeros(count, dtype=numpy.bool_)
+        self.bunch_center_x = numpy.zeros(count, dtype=numpy.int32)
+        self.bunch_center_y = numpy.zeros(count, dtype=numpy.int32)
+        self.neighbors = numpy.full((count, len(NEIGHBOR_DIRECTIONS)), -1, dtype=numpy.int32)
+        self.sea_mask = numpy.zeros(count, dtype=numpy.uint8)
+        self.sea_border_mask = numpy.zeros(count, dtype=numpy.uint8)
+
+
+class TileList(object):
+    """ The Tile of each row of a TileStore, only made once something asks for it """
+
+    def __init__(self, store):
+        self.store = store
+        self.tiles = [None] * store.count
+
+    def __len__(self):
+        return self.store.count
 
-    def __init__(self, x, y, x_pos, y_pos, terrain, feature_map=None):
-        self.terrain = terrain
-        self.x, self.y = x, y
-        self.x_pos = x_pos
-        self.y_pos = y_pos
-        self.imgnum = (self.x % 2) * 2 + (self.y - self.x / 2) % 2
+    def __getitem__(self, row):
+        tile = self.tiles[row]
+        if tile is None:
+            tile = self.tiles[row] = Tile(self.store, row)
+        return tile
+
+    def __iter__(self):
+        for row in xrange(self.store.count):
+            yield self[row]
+
+
+class Tile(object):
+    """ A view over one row of a TileStore, plus the sprites currently drawn for it. """
+    __slots__ = [
+        "store", "row", "sprite", "shroud_sprite", "shroud_gone", "coor_sprite", "feature_map",
+        "is_in_view", "feature_sprites", "locale_sprite",
+    ]
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
         self.sprite = None
         self.shroud_sprite = None
         self.shroud_gone = False
         self.coor_sprite = None
         self.feature_map = None
-        self.locale = None
-        self.explored = False
-        self.edged = False
         self.is_in_view = False
-        self.tile_bunch_direction = get_tile_bunch_position(self.x, self.y)
-        self.tile_bunch_center = get_tile_bunch_center(self.x, self.y)
         self.feature_sprites = None
+        self.locale_sprite = None
+
+    @property
+    def x(self):
+        return int(self.store.x[self.row])
+
+    @property
+    def y(self):
+        return int(self.store.y[self.row])
+
+    @property
+    def x_pos(self):
+        return int(self.store.x_pos[self.row])
+
+    @property
+    def y_pos(self):
+        return int(self.store.y_pos[self.row])
+
+    @property
+    def terrain(self):
+        return TERRAINS[self.store.terrain[self.row]]
+
+    @terrain.setter
+    def terrain(self, terrain):
+        self.store.terrain[self.row] = TERRAIN_CODES[terrain]
+
+    @property
+    def locale(self):
+        return LOCALES[self.store.locale[self.row]]
+
+    @locale.setter
+    def locale(self, locale):
+        self.store.locale[self.row] = LOCALE_CODES[locale]
+
+    @property
+    def explored(self):
+        return bool(self.store.explored[self.row])
+
+    @explored.setter
+    def explored(self, explored):
+        self.store.explored[self.row] = explored
+
+    @property
+    def edged(self):
+        return bool(self.store.edged[self.row])
+
+    @edged.setter
+    def edged(self, edged):
+        self.store.edged[self.row] = edged
+
+    @property
+    def tile_bunch_center(self):
+        return int(self.store.bunch_center_x[self.row]), int(self.store.bunch_center_y[self.row])
+
+    @property
+    def tile_bunch_direction(self):
+        return get_tile_bunch_position(self.x, self.y)
+
+    @property
+    def imgnum(self):
+        x, y = self.x, self.y
+        return (x % 2) * 2 + (y - x / 2) % 2
 
     def get_neighbor(self, direction):
-        xd, yd = DIRECTIONS[direction]
-        return TileMap.gettile(self.x + xd, self.y + yd)
+        if direction == 'HOME':
+            return self
+        row = self.store.neighbors[self.row, NEIGHBOR_INDEX[direction]]
+        if row < 0:
+            return None
+        return TileMap.tiles[row]
 
     def get_new_sprites(self):
-        self.is_in_view = MainWindowManager.is_position_in_view(
-            self.x_pos, self.y_pos, conf.tile_width * 1.5, conf.tile_height * 3.0
-        )
         if not self.is_in_view:
             pass
         elif self.explored and not self.sprite:
@@ -388,8 +760,8 @@ class Tile(object):
         elif self.terrain == 'mountain':
             self.feature_map = TileMap.get_feature_map('terrain.mountain_{}'.format(self.imgnum))
 
-        self.sprite = Sprite(
-            x=self.x_pos, y=self.y_pos, master=master, component_name=component_name,
+        self.sprite = SpriteManager.pool.acquire(
+            component_name, x=self.x_pos, y=self.y_pos, master=master,
             z_group=self.get_z_group(),
         )
 
@@ -401,7 +773,7 @@ class Tile(object):
     def get_z_group(self):
         return self.terrain == 'sea' and SEA_GROUP or TILE_GROUP
 
-    def start_tile_animation(self, extra_time=timedelta(0)):
+    def start_tile_animation(self, extra_time=0.0):
         self.sprite.start_animation(
             "terrain.sea.sea_{}".format(self.imgnum), extra_time=extra_time,
             end_callback=self.start_tile_animation
@@ -411,10 +783,14 @@ class Tile(object):
         self.explored = True
         if self.shroud_sprite:
             self.remove_shroud(source)
+        TileMap.record_exploration(self)
+        TileMap.refresh_tile(self)
 
     def edge(self):
         self.edged = True
         self.shroud_gone = False
+        TileMap.record_exploration(self)
+        TileMap.refresh_tile(self)
 
     def remove_shroud(self, source):
         dir_x = self.x - source[0]
@@ -432,11 +808,11 @@ class Tile(object):
 
     def set_shroud_to_gone(self, extra_time=None):
         self.shroud_gone = True
+        TileMap.refresh_tile(self)
 
     def make_shroud_sprite(self):
-        self.shroud_sprite = Sprite(
-            x=self.x_pos, y=self.y_pos, component_name="terrain.shroud",
-            z_group=UNIT_GROUP,
+        self.shroud_sprite = SpriteManager.pool.acquire(
+            "terrain.shroud", x=self.x_pos, y=self.y_pos, z_group=UNIT_GROUP,
         )
 
     def make_coor_sprite(self):
@@ -461,81 +837,22 @@ class Tile(object):
                 self.make_feature_sprite(feature_name, x, y)
 
     def make_sea_borders(self):
-        sprite_names = [
-            ('S', "terrain.features.sea_border_s"),
-            ('SW', "terrain.features.sea_border_sw"),
-            ('NW', "terrain.features.sea_border_nw"),
-        ]
-        for direction, sprite_name in sprite_names:
-            neighbor = self.get_neighbor(direction)
-            if (    neighbor
-                and neighbor.terrain == 'sea'
-                and neighbor.tile_bunch_center != self.tile_bunch_center
-               ):
-                self.make_feature_sprite(
-                    sprite_name, 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-                )
-
-    def make_shores(self):
-        neighbor_terrain = dict(
-            [(x, self.get_neighbor(x) and self.get_neighbor(x).terrain) for x in DIRECTIONS]
-        )
-        if neighbor_terrain["N"] != "sea" and neighbor_terrain["NW"] == "sea":
+        for sprite_name in SEA_BORDER_OVERLAYS[self.store.sea_border_mask[self.row]]:
             self.make_feature_sprite(
-                "terrain.features.shore_out_sw", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
+                sprite_name, 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
             )
-        if neighbor_terrain["N"] != "sea" and neighbor_terrain["NE"] == "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_out_se", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["SW"] != "sea" and neighbor_terrain["S"] == "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_out_e", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["S"] != "sea" and neighbor_terrain["SE"] == "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_out_ne", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["S"] != "sea" and neighbor_terrain["SW"] == "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_out_nw", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["SE"] != "sea" and neighbor_terrain["S"] == "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_out_w", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["S"] != "sea" and neighbor_terrain["SW"] != "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_in_sw", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["S"] != "sea" and neighbor_terrain["SE"] != "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_in_se", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["SE"] != "sea" and neighbor_terrain["NE"] != "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_in_e", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["N"] != "sea" and neighbor_terrain["NE"] != "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_in_ne", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["SW"] != "sea" and neighbor_terrain["NW"] != "sea":
-            self.make_feature_sprite(
-                "terrain.features.shore_in_w", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
-            )
-        if neighbor_terrain["NW"] != "sea" and neighbor_terrain["N"] != "sea":
+
+    def make_shores(self):
+        for sprite_name in SHORE_OVERLAYS[self.store.sea_mask[self.row]]:
             self.make_feature_sprite(
-                "terrain.features.shore_in_nw", 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
+                sprite_name, 0, 0, anchor="tile", z_group=TILE_OVERLAY_GROUP
             )
 
-
     def is_similar_terrain(self, direction):
-        d = DIRECTIONS[direction]
-        other_x = self.x + d[0]
-        other_y = self.y + d[1]
-        other = TileMap.gettile(other_x, other_y)
-        return other is not None and other.terrain == self.terrain
+        if direction == 'HOME':
+            return True
+        row = self.store.neighbors[self.row, NEIGHBOR_INDEX[direction]]
+        return bool(row >= 0 and self.store.terrain[row] == self.store.terrain[self.row])
 
     def make_locale_sprite(self):
         component_name = "locale.{}".format(self.locale)
@@ -546,9 +863,8 @@ class Tile(object):
         self.locale_sprite = sprite
 
     def make_feature_sprite(self, feature_name, x, y, anchor="stand", z_group=UNIT_GROUP):
-        sprite = Sprite(
-            component_name=feature_name, x=x, y=y, z_group=z_group, anchor=anchor,
-            parent=self.sprite
+        sprite = SpriteManager.pool.acquire(
+            feature_name, x=x, y=y, z_group=z_group, anchor=anchor, parent=self.sprite
         )
         self.feature_sprites.append(sprite)
 
@@ -559,7 +875,9 @@ class Tile(object):
         return unicode(self)
 
     def __unicode__(self):
-        return "Tile({x}, {y}, {x_pos}, {y_pos}, {terrain})".format(**self.__dict__)
+        return "Tile({}, {}, {}, {}, {})".format(
+            self.x, self.y, self.x_pos, self.y_pos, self.terrain
+        )
 
 
 class FeatureMap(object):
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from contextlib import contextmanager
 import logging
 
@@ -65,6 +66,36 @@ class SettingBased(object):
         self.settingset.processvalues(self, kwargs)
 
 
+class OrderedSet(object):
+    """ A set that keeps insertion order, with O(1) add, remove and membership tests """
+
+    def __init__(self, items=()):
+        self.items = OrderedDict()
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        self.items[item] = None
+
+    def remove(self, item):
+        del self.items[item]
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return "OrderedSet({})".format(list(self.items))
+
+
 def insert_sort(almost_sorted):
     for i in range(1, len(almost_sorted)):
         val = almost_sorted[i]
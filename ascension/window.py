@@ -34,6 +34,7 @@ class MainWindowManager(object):
         self.position_updated = True
         self.sprite_view_width = conf.fixed_scroller_width
         self.sprite_view_height = conf.fixed_scroller_height
+        self.scroll_velocity = (0.0, 0.0)
 
     def tick(self, time_passed):
         ProfilerManager.start("TICK")
@@ -69,6 +70,9 @@ class MainWindowManager(object):
         self.ydiff += y
         self.position_updated = True
 
+    def set_scroll_velocity(self, x, y):
+        self.scroll_velocity = (x, y)
+
     def open(self):
         LOG.info("Window '{}' opened".format(self))
         self.pyglet_window = pyglet.window.Window(
@@ -143,6 +147,12 @@ class MainWindowManager(object):
         ydiff = abs(y - self.y) - extra_y
         return xdiff <= self.sprite_view_width and ydiff <= self.sprite_view_height
 
+    def get_view_rect(self, extra_x=0.0, extra_y=0.0):
+        """ (min_x, min_y, max_x, max_y) of the positions is_position_in_view accepts """
+        width = self.sprite_view_width + extra_x
+        height = self.sprite_view_height + extra_y
+        return self.x - width, self.y - height, self.x + width, self.y + height
+
 
 def drawRect(x, y=None, width=None, height=None):
     if (y, width, height) == (None, None, None):
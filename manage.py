@@ -1,14 +1,30 @@
+import pyglet
+# No manage command draws anything, so pyglet doesn't need its hidden shadow window
+pyglet.options['shadow_window'] = False
+
 from tools.make_atlas import AtlasGenerator
 from tools.make_sea import SeaGenerator
 from tools.make_forest import ForestGenerator
 from tools.make_grassland import GrasslandGenerator
 from tools.make_mountain import MountainGenerator
 from tools.make_shore import ShoreGenerator
+from tools import bench_transitions, bench_mapgen
 import sys
 
 
+def pop_option(args, name, default, parse=str):
+    if name not in args:
+        return default
+    index = args.index(name)
+    value = parse(args[index + 1])
+    del args[index:index + 2]
+    return value
+
+
 if sys.argv[1] == "make_atlas":
-    AtlasGenerator.make_atlas(*sys.argv[2:])
+    args = sys.argv[2:]
+    jobs = pop_option(args, "--jobs", 1, parse=int)
+    AtlasGenerator.make_atlas(*args, jobs=jobs)
 elif sys.argv[1] == "make_shore":
     ShoreGenerator.generate(outdir=sys.argv[2])
 elif sys.argv[1] == "make_sea":
@@ -19,5 +35,19 @@ elif sys.argv[1] == "make_forest":
     ForestGenerator.make_features(outdir=sys.argv[2])
 elif sys.argv[1] == "make_mountain":
     MountainGenerator.make_features(outdir=sys.argv[2])
+elif sys.argv[1] == "bench_transitions":
+    args = sys.argv[2:]
+    engine_count = pop_option(args, "--engines", 1000, parse=int)
+    ticks = pop_option(args, "--ticks", 100, parse=int)
+    bench_transitions.main(engine_count=engine_count, ticks=ticks)
+elif sys.argv[1] == "bench_mapgen":
+    args = sys.argv[2:]
+    sizes = pop_option(
+        args, "--sizes", bench_mapgen.SIZES, parse=lambda v: [int(s) for s in v.split(",")]
+    )
+    seed = pop_option(args, "--seed", 111, parse=int)
+    output = pop_option(args, "--output", None)
+    compare = pop_option(args, "--compare", None)
+    bench_mapgen.main(sizes=sizes, seed=seed, output=output, compare=compare)
 else:
     raise Exception("No manage command '{}'".format(sys.argv[1]))
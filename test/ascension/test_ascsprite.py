@@ -0,0 +1,309 @@
+from unittest2 import TestCase
+import os
+import shutil
+import tempfile
+import json
+import ctypes
+from datetime import timedelta
+
+
+from ascension.ascsprite import (
+    load_atlas_meta, dump_atlas_meta, get_atlas_meta_sidecar, ATLAS_META_CACHE, SpritePool,
+    TILE_GROUP, UNIT_GROUP, Sprite, TransitionRuntime, EngineTable,
+    AnimationGroup, SpriteManager
+)
+from ascension.settings import AscensionConf as conf, get_scaled_img_dir
+
+
+class AtlasStub(object):
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+
+
+class TestAtlasScale(TestCase):
+    components = [{"x": 10, "y": 0, "width": 20, "height": 30}]
+
+    def setUp(self):
+        self.manager = SpriteManager.__new__(SpriteManager)
+
+    def test_atlas_image_follows_sprite_scale(self):
+        self.assertEqual(
+            os.path.join(get_scaled_img_dir(conf.sprite_scale), "ASCENSION_ATLAS.png"),
+            conf.atlas_image
+        )
+
+    def test_scaled_img_dir(self):
+        self.assertEqual("data/img", get_scaled_img_dir(1))
+        self.assertEqual("data/img/x3", get_scaled_img_dir(3))
+        with self.assertRaises(ValueError):
+            get_scaled_img_dir(4)
+
+    def test_check_atlas_size(self):
+        self.manager.atlas = AtlasStub(30 * conf.sprite_scale, 30 * conf.sprite_scale)
+        self.manager.check_atlas_size(self.components)
+        self.manager.atlas = AtlasStub(30 * (conf.sprite_scale - 1), 30 * conf.sprite_scale)
+        with self.assertRaises(ValueError):
+            self.manager.check_atlas_size(self.components)
+
+
+class TestAtlasMeta(TestCase):
+    atlas_meta = {
+        "components": [{"name": "unit.sword.stand", "width": 15, "height": 17}],
+        "animations": [],
+        "feature_maps": {},
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.meta_path = os.path.join(self.directory, "ASCENSION_ATLAS_META.json")
+        ATLAS_META_CACHE.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        ATLAS_META_CACHE.clear()
+
+    def test_load_sidecar(self):
+        dump_atlas_meta(self.atlas_meta, self.meta_path)
+        self.assertTrue(os.path.isfile(get_atlas_meta_sidecar(self.meta_path)))
+        with open(self.meta_path) as f:
+            self.assertEqual(json.load(f), self.atlas_meta)
+        self.assertEqual(load_atlas_meta(self.meta_path), self.atlas_meta)
+
+    def test_load_json_without_sidecar(self):
+        with open(self.meta_path, "w") as f:
+            json.dump(self.atlas_meta, f)
+        self.assertEqual(load_atlas_meta(self.meta_path), self.atlas_meta)
+
+    def test_stale_sidecar_ignored(self):
+        dump_atlas_meta(self.atlas_meta, self.meta_path)
+        sidecar_path = get_atlas_meta_sidecar(self.meta_path)
+        os.utime(sidecar_path, (0, 0))
+        with open(self.meta_path, "w") as f:
+            json.dump({"components": []}, f)
+        self.assertEqual(load_atlas_meta(self.meta_path), {"components": []})
+
+    def test_loaded_once(self):
+        dump_atlas_meta(self.atlas_meta, self.meta_path)
+        first = load_atlas_meta(self.meta_path)
+        os.remove(self.meta_path)
+        os.remove(get_atlas_meta_sidecar(self.meta_path))
+        self.assertIs(load_atlas_meta(self.meta_path), first)
+
+
+class PygletSpriteStub(object):
+    visible = True
+    opacity = 255
+
+
+class TestSpritePool(TestCase):
+
+    def setUp(self):
+        TransitionRuntime.reset()
+        self.pool = SpritePool()
+
+    def test_reuse_released(self):
+        sprite = self.pool.acquire(None, x=3, y=4, z_group=UNIT_GROUP, opacity=100)
+        sprite.pyglet_sprite = PygletSpriteStub()
+        sprite.static_delay(1)
+        self.pool.release(sprite)
+        self.assertFalse(sprite.pyglet_sprite.visible)
+        self.assertEqual(list(sprite.transition_engines), [])
+        self.assertEqual(self.pool.get_free_count(), 1)
+
+        reused = self.pool.acquire(None, x=5, y=6, z_group=UNIT_GROUP)
+        self.assertIs(reused, sprite)
+        self.assertEqual((reused.x, reused.y, reused.opacity), (5, 6, 255))
+        self.assertEqual(reused.pyglet_sprite.opacity, 255)
+        self.assertFalse(reused.deleted)
+        self.assertEqual(self.pool.get_free_count(), 0)
+        self.assertEqual((self.pool.hits, self.pool.misses), (1, 1))
+        self.assertEqual(self.pool.get_hit_rate(), 0.5)
+
+    def test_keyed_by_z_group(self):
+        sprite = self.pool.acquire(None, z_group=UNIT_GROUP)
+        self.pool.release(sprite)
+        self.assertIsNot(self.pool.acquire(None, z_group=TILE_GROUP), sprite)
+        self.assertIs(self.pool.acquire(None, z_group=UNIT_GROUP), sprite)
+
+    def test_reset_parent(self):
+        parent = self.pool.acquire(None, z_group=TILE_GROUP)
+        child = self.pool.acquire(None, z_group=UNIT_GROUP, parent=parent)
+        self.assertEqual(parent.subsprites, [child])
+        self.pool.release(child)
+        self.pool.release(parent)
+        self.assertIsNone(child.parent)
+        parent = self.pool.acquire(None, z_group=TILE_GROUP)
+        self.assertEqual(parent.subsprites, [])
+
+
+class TestDepthKey(TestCase):
+
+    def test_order(self):
+        keys = [
+            Sprite(z_group=UNIT_GROUP).get_pyglet_z(x, y)
+            for (x, y) in [(-500, -300), (400, -300), (-600, -299), (0, 0), (0.5, 0), (1, 0)]
+        ]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(keys[3], keys[4])
+        self.assertLess(
+            Sprite(z_group=UNIT_GROUP).get_pyglet_z(5000, 5000),
+            Sprite(z_group=TILE_GROUP).get_pyglet_z(-5000, -5000),
+        )
+
+
+class TestTransitionRuntime(TestCase):
+
+    def setUp(self):
+        TransitionRuntime.reset()
+        self.ended = []
+
+    def on_end(self, name):
+        return lambda extra_time: self.ended.append((name, extra_time))
+
+    def test_move(self):
+        sprite = Sprite(x=0, y=0)
+        sprite.move_to((30, 40), 10, end_callback=self.on_end("move"))
+        TransitionRuntime.step(2.0)
+        self.assertAlmostEqual(sprite.x, 12)
+        self.assertAlmostEqual(sprite.y, 16)
+        self.assertEqual(self.ended, [])
+        TransitionRuntime.step(3.5)
+        self.assertEqual((sprite.x, sprite.y), (30, 40))
+        self.assertEqual(self.ended, [("move", 0.5)])
+        self.assertEqual(list(sprite.transition_engines), [])
+        self.assertEqual(TransitionRuntime.get_engine_count(), 0)
+
+    def test_fade(self):
+        sprite = Sprite(opacity=255)
+        sprite.fade(duration=1, end_callback=self.on_end("fade"))
+        TransitionRuntime.step(0.5)
+        self.assertEqual(sprite.opacity, 127)
+        TransitionRuntime.step(0.25)
+        self.assertEqual(sprite.opacity, 63)
+        self.assertEqual(self.ended, [])
+        TransitionRuntime.step(0.5)
+        self.assertEqual(sprite.opacity, 0)
+        self.assertEqual(len(self.ended), 1)
+        self.assertAlmostEqual(self.ended[0][1], 0.25)
+
+    def test_static_delay_then_fade(self):
+        sprite = Sprite(opacity=255)
+        sprite.fade(static_delay=1, duration=1, end_callback=self.on_end("fade"))
+        TransitionRuntime.step(0.5)
+        self.assertEqual(sprite.opacity, 255)
+        TransitionRuntime.step(1.0)
+        self.assertEqual(sprite.opacity, 127)
+        TransitionRuntime.step(0.5)
+        self.assertEqual([name for name, _ in self.ended], ["fade"])
+
+    def test_timedelta_extra_time(self):
+        sprite = Sprite()
+        sprite.static_delay(
+            1, extra_time=timedelta(seconds=0.75), end_callback=self.on_end("delay")
+        )
+        TransitionRuntime.step(0.5)
+        self.assertEqual(self.ended, [("delay", 0.25)])
+
+    def test_only_completed_callbacks(self):
+        sprites = [Sprite() for _ in range(100)]
+        for i, sprite in enumerate(sprites):
+            sprite.static_delay(i + 0.5, end_callback=self.on_end(i))
+        TransitionRuntime.step(10)
+        self.assertEqual(sorted([name for name, _ in self.ended]), range(10))
+        self.assertEqual(TransitionRuntime.get_engine_count(), 90)
+
+    def test_delete_stops_engines(self):
+        first, second = Sprite(), Sprite()
+        first.static_delay(1, end_callback=lambda extra_time: second.delete())
+        second.static_delay(1, end_callback=self.on_end("second"))
+        TransitionRuntime.step(1)
+        self.assertEqual(self.ended, [])
+        self.assertEqual(TransitionRuntime.get_engine_count(), 0)
+
+    def test_needs_tick(self):
+        sprite = Sprite()
+        sprite.xyz_updated = False
+        self.assertFalse(sprite.needs_tick())
+        sprite.static_delay(1)
+        self.assertFalse(sprite.needs_tick())
+        sprite.move_to((10, 0), 10)
+        TransitionRuntime.step(0.5)
+        self.assertTrue(sprite.needs_tick())
+
+
+class TestEngineTable(TestCase):
+
+    def test_rows_reused(self):
+        table = EngineTable(["remaining"], capacity=2)
+        rows = [table.add(object(), remaining=i) for i in range(5)]
+        self.assertEqual(rows, range(5))
+        self.assertEqual(list(table.remaining[:5]), range(5))
+        table.remove(3)
+        self.assertEqual(list(table.get_active_rows()), [0, 1, 2, 4])
+        self.assertEqual(table.add(object(), remaining=7), 3)
+        self.assertEqual(len(table), 5)
+
+
+class RegionStub(object):
+
+    def __init__(self, array):
+        self.array = array
+        self.invalidated = False
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+class TexCoordAttributeStub(object):
+
+    def __init__(self, vertex_count):
+        self.buffer = (ctypes.c_float * (vertex_count * 3))()
+        self.regions = []
+
+    def get_region(self, buffer, start, count):
+        array = (ctypes.c_float * (count * 3)).from_buffer(buffer, start * 3 * 4)
+        self.regions.append(RegionStub(array))
+        return self.regions[-1]
+
+
+class DomainStub(object):
+
+    def __init__(self, vertex_count):
+        self.attribute_names = {"tex_coords": TexCoordAttributeStub(vertex_count)}
+
+
+class VertexListStub(object):
+    count = 4
+
+    def __init__(self, domain, start):
+        self.domain = domain
+        self.start = start
+
+
+class FollowerStub(object):
+
+    def __init__(self, vertex_list=None):
+        self.pyglet_sprite = vertex_list and type(
+            "PygletSprite", (object,), {"_vertex_list": vertex_list}
+        )
+
+
+class ImageStub(object):
+    tex_coords = tuple(range(12))
+
+
+class TestAnimationGroup(TestCase):
+
+    def test_write_tex_coords(self):
+        domain = DomainStub(16)
+        followers = [FollowerStub(VertexListStub(domain, start)) for start in (4, 12)]
+        followers.append(FollowerStub())
+        group = AnimationGroup(followers)
+        group.write_tex_coords(ImageStub())
+        tex_coords = list(domain.attribute_names["tex_coords"].buffer)
+        self.assertEqual(tex_coords[:12], [0] * 12)
+        self.assertEqual(tex_coords[12:24], range(12))
+        self.assertEqual(tex_coords[24:36], [0] * 12)
+        self.assertEqual(tex_coords[36:], range(12))
+        self.assertTrue(domain.attribute_names["tex_coords"].regions[0].invalidated)
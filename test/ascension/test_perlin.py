@@ -0,0 +1,77 @@
+from unittest2 import TestCase
+from decimal import Decimal
+import random
+
+import numpy
+
+from ascension.perlin import (
+    TileablePerlinGenerator, FLOAT_TOLERANCE, get_coor_set, get_random_float_vector
+)
+
+
+class TestTileablePerlinGenerator(TestCase):
+
+    def setUp(self):
+        random.seed(5)
+        self.points = [(random.random(), random.random(), random.random()) for _ in range(50)]
+
+    def get_decimal_values(self, generator, points):
+        values = []
+        for point in points:
+            point = [Decimal(p) for p in point[:len(generator.dimensions)]]
+            values.append(float(generator.get_value(*point)))
+        return numpy.array(values)
+
+    def test_get_values_matches_get_value_2d(self):
+        generator = TileablePerlinGenerator(dimensions=(3, 5), seed=32)
+        xs, ys, _ = numpy.array(self.points).T
+        expected = self.get_decimal_values(generator, self.points)
+        actual = generator.get_values(xs, ys)
+        self.assertTrue(numpy.allclose(expected, actual, rtol=0, atol=1e-12))
+
+    def test_get_values_matches_get_value_3d(self):
+        generator = TileablePerlinGenerator(dimensions=(8, 50, 2), seed=1)
+        xs, ys, zs = numpy.array(self.points).T
+        expected = self.get_decimal_values(generator, self.points)
+        actual = generator.get_values(xs, ys, zs)
+        self.assertTrue(numpy.allclose(expected, actual, rtol=0, atol=1e-12))
+
+    def test_get_values_broadcasts(self):
+        generator = TileablePerlinGenerator(dimensions=(8, 50, 2), seed=1)
+        xs, ys = numpy.meshgrid(numpy.linspace(0, 1, 7), numpy.linspace(0, 1, 4), indexing="ij")
+        values = generator.get_values(xs, ys, 0.3)
+        self.assertEqual((7, 4), values.shape)
+        self.assertAlmostEqual(
+            float(generator.get_value(Decimal(xs[2, 3]), Decimal(ys[2, 3]), Decimal(0.3))),
+            values[2, 3]
+        )
+
+    def test_get_values_is_tileable(self):
+        generator = TileablePerlinGenerator(dimensions=(4, 6), seed=3)
+        ys = numpy.linspace(0, 1, 11)
+        left = generator.get_values(numpy.zeros(11), ys)
+        right = generator.get_values(numpy.zeros(11) + 0.999999999, ys)
+        self.assertTrue(numpy.allclose(left, right, atol=1e-6))
+
+    def test_float_precision_within_tolerance(self):
+        decimal_generator = TileablePerlinGenerator(dimensions=(8, 50, 2), seed=1)
+        float_generator = TileablePerlinGenerator(dimensions=(8, 50, 2), seed=1, precision="float")
+        for point in self.points:
+            expected = decimal_generator.get_value(*[Decimal(p) for p in point])
+            actual = float_generator.get_value(*point)
+            self.assertLess(abs(float(expected) - actual), FLOAT_TOLERANCE)
+
+    def test_float_precision_is_deterministic(self):
+        first = TileablePerlinGenerator(dimensions=(4, 6), seed=3, precision="float")
+        second = TileablePerlinGenerator(dimensions=(4, 6), seed=3, precision="float")
+        self.assertEqual(first.vectors, second.vectors)
+
+    def test_float_vectors_match_random_float_vector(self):
+        generator = TileablePerlinGenerator(dimensions=(5, 7, 3), seed=11, precision="float")
+        random.seed(11)
+        for coor in get_coor_set((5, 7, 3)):
+            self.assertEqual(get_random_float_vector(3), generator.vectors[tuple(coor)])
+
+    def test_unknown_precision(self):
+        with self.assertRaises(ValueError):
+            TileablePerlinGenerator(dimensions=(4, 6), precision="half")
@@ -0,0 +1,40 @@
+from unittest2 import TestCase
+import random
+
+
+import numpy
+
+
+from ascension.spatial import GridIndex
+
+
+class TestGridIndex(TestCase):
+
+    def setUp(self):
+        random.seed(7)
+        self.x = numpy.array([random.randint(-500, 500) for _ in range(400)])
+        self.y = numpy.array([random.randint(-300, 300) for _ in range(400)])
+        self.index = GridIndex(self.x, self.y, 71, 30)
+
+    def get_expected(self, min_x, min_y, max_x, max_y):
+        return [
+            i for i in range(len(self.x))
+            if min_x <= self.x[i] <= max_x and min_y <= self.y[i] <= max_y
+        ]
+
+    def test_query(self):
+        for _ in range(50):
+            min_x, min_y = random.uniform(-600, 600), random.uniform(-400, 400)
+            max_x, max_y = min_x + random.uniform(0, 400), min_y + random.uniform(0, 300)
+            self.assertEqual(
+                self.index.query(min_x, min_y, max_x, max_y).tolist(),
+                self.get_expected(min_x, min_y, max_x, max_y),
+            )
+
+    def test_query_edges_inclusive(self):
+        x, y = self.x[0], self.y[0]
+        self.assertIn(0, self.index.query(x, y, x, y).tolist())
+
+    def test_empty(self):
+        index = GridIndex([], [], 10, 10)
+        self.assertEqual(index.query(-100, -100, 100, 100).tolist(), [])
@@ -1,5 +1,18 @@
 from unittest2 import TestCase
-from ascension.tilemap import SimpleHexMoveRules, AStar
+import os
+import random
+import shutil
+import tempfile
+
+import numpy
+
+from ascension.tilemap import (
+    SimpleHexMoveRules, AStar, TileMap, DIRECTIONS, NEIGHBOR_DIRECTIONS, TERRAINS,
+    SHORE_OVERLAYS, SEA_BORDER_OVERLAYS
+)
+from ascension.settings import AscensionConf as conf, PlayerConf
+from ascension.window import MainWindowManager
+from ascension.mapfile import MapFile, MapFileError, HEADER_DTYPE
 
 
 class TestSimpleHexMoveRules(TestCase):
@@ -58,3 +71,305 @@ class TestAStar(TestCase):
 
 
 
+
+
+def make_tilemap(width, height):
+    tilemap = TileMap.__new__(TileMap)
+    tilemap.reset_tiles()
+    tilemap.generate_square(width=width, height=height)
+    return tilemap
+
+
+class TestTileStore(TestCase):
+
+    def setUp(self):
+        self.tilemap = make_tilemap(14, 14)
+
+    def test_generate_square(self):
+        self.assertEqual(14 * 14, self.tilemap.count)
+        self.assertEqual(14 * 14, self.tilemap.store.count)
+        tile = self.tilemap.gettile(3, -2)
+        self.assertEqual((3, -2), (tile.x, tile.y))
+        self.assertEqual((3 * 55, -2 * 30 + 3 * 15), (tile.x_pos, tile.y_pos))
+        self.assertEqual("sea", tile.terrain)
+        self.assertEqual((3, -2), tile.tile_bunch_center)
+
+    def test_gettile_wraps(self):
+        self.assertIs(self.tilemap.gettile(-7, 3), self.tilemap.gettile(7, -4))
+        self.assertIs(self.tilemap.gettile(0, 0), self.tilemap.gettile(14, -7))
+        self.assertIsNone(self.tilemap.gettile(0, 7))
+
+    def test_hastile_does_not_wrap(self):
+        self.assertTrue(self.tilemap.hastile(-7, 3))
+        self.assertFalse(self.tilemap.hastile(7, -4))
+        self.assertFalse(self.tilemap.hastile(0, 7))
+
+    def test_tile_writes_through_to_store(self):
+        tile = self.tilemap.gettile(1, 1)
+        tile.terrain = "forest"
+        tile.explored = True
+        tile.locale = "village"
+        self.assertEqual("forest", self.tilemap.gettile(1, 1).terrain)
+        self.assertTrue(self.tilemap.store.explored[tile.row])
+        self.assertEqual("village", self.tilemap.gettile(1, 1).locale)
+
+    def test_neighbor_table(self):
+        for width, height in [(14, 14), (28, 42)]:
+            tilemap = make_tilemap(width, height)
+            for tile in tilemap.tiles:
+                for i, direction in enumerate(NEIGHBOR_DIRECTIONS):
+                    xd, yd = DIRECTIONS[direction]
+                    row = tilemap.get_row(tile.x + xd, tile.y + yd)
+                    self.assertEqual(
+                        tilemap.store.neighbors[tile.row, i], -1 if row is None else row
+                    )
+
+    def test_similar_terrain_mask(self):
+        tile = self.tilemap.gettile(1, 1)
+        tile.terrain = "forest"
+        self.tilemap.gettile(1, 2).terrain = "forest"
+        mask = self.tilemap.get_similar_terrain_mask()
+        self.assertEqual(mask[tile.row].tolist(), [True, False, False, False, False, False])
+        bottom = self.tilemap.gettile(0, -7)
+        self.assertFalse(mask[bottom.row, NEIGHBOR_DIRECTIONS.index('S')])
+
+
+def get_shores(is_sea):
+    """ The chain of neighbor conditions make_shores used to check """
+    shores = []
+    for name, rule in [
+        ("out_sw", not is_sea["N"] and is_sea["NW"]),
+        ("out_se", not is_sea["N"] and is_sea["NE"]),
+        ("out_e", not is_sea["SW"] and is_sea["S"]),
+        ("out_ne", not is_sea["S"] and is_sea["SE"]),
+        ("out_nw", not is_sea["S"] and is_sea["SW"]),
+        ("out_w", not is_sea["SE"] and is_sea["S"]),
+        ("in_sw", not is_sea["S"] and not is_sea["SW"]),
+        ("in_se", not is_sea["S"] and not is_sea["SE"]),
+        ("in_e", not is_sea["SE"] and not is_sea["NE"]),
+        ("in_ne", not is_sea["N"] and not is_sea["NE"]),
+        ("in_w", not is_sea["SW"] and not is_sea["NW"]),
+        ("in_nw", not is_sea["NW"] and not is_sea["N"]),
+    ]:
+        if rule:
+            shores.append("terrain.features.shore_{}".format(name))
+    return tuple(shores)
+
+
+class TestOverlayMasks(TestCase):
+
+    def test_shore_overlays(self):
+        for sea_mask in range(64):
+            is_sea = dict([
+                (direction, bool(sea_mask & (1 << i)))
+                for i, direction in enumerate(NEIGHBOR_DIRECTIONS)
+            ])
+            self.assertEqual(SHORE_OVERLAYS[sea_mask], get_shores(is_sea))
+
+    def test_calc_overlay_masks(self):
+        tilemap = make_tilemap(28, 28)
+        random.seed(3)
+        for tile in tilemap.tiles:
+            tile.terrain = random.choice(TERRAINS)
+        tilemap.calc_overlay_masks()
+        for tile in tilemap.tiles:
+            is_sea, borders = {}, []
+            for direction in NEIGHBOR_DIRECTIONS:
+                xd, yd = DIRECTIONS[direction]
+                neighbor = tilemap.gettile(tile.x + xd, tile.y + yd)
+                is_sea[direction] = neighbor is not None and neighbor.terrain == "sea"
+                if (
+                        direction in ("S", "SW", "NW")
+                    and is_sea[direction]
+                    and neighbor.tile_bunch_center != tile.tile_bunch_center
+                ):
+                    borders.append(direction)
+            self.assertEqual(SHORE_OVERLAYS[tilemap.store.sea_mask[tile.row]], get_shores(is_sea))
+            self.assertEqual(
+                SEA_BORDER_OVERLAYS[tilemap.store.sea_border_mask[tile.row]],
+                tuple(["terrain.features.sea_border_{}".format(d.lower()) for d in borders]),
+            )
+
+
+class TestTileMapView(TestCase):
+
+    def setUp(self):
+        self.tilemap = make_tilemap(28, 28)
+
+    def get_expected(self, min_x, min_y, max_x, max_y):
+        return set([
+            tile.row for tile in self.tilemap.tiles
+            if min_x <= tile.x_pos <= max_x and min_y <= tile.y_pos <= max_y
+        ])
+
+    def test_update_view(self):
+        first = (-200, -150, 250, 120)
+        self.tilemap.update_view(first)
+        self.assertEqual(self.tilemap.rows_in_view, self.get_expected(*first))
+        self.assertEqual(set(self.tilemap.rows_entered_view), self.get_expected(*first))
+        self.assertEqual(self.tilemap.rows_left_view, [])
+        second = (-100, -150, 350, 120)
+        self.tilemap.update_view(second)
+        self.assertEqual(
+            set(self.tilemap.rows_entered_view),
+            self.get_expected(*second) - self.get_expected(*first),
+        )
+        self.assertEqual(
+            set(self.tilemap.rows_left_view),
+            self.get_expected(*first) - self.get_expected(*second),
+        )
+        for tile in self.tilemap.tiles:
+            self.assertEqual(tile.is_in_view, tile.row in self.get_expected(*second))
+
+    def test_keep_rect(self):
+        view = (-100, -100, 100, 100)
+        load = (-100, -100, 300, 100)
+        self.tilemap.update_view(view, load, (-300, -300, 300, 300))
+        self.assertEqual(self.tilemap.rows_in_view, self.get_expected(*load))
+        self.tilemap.update_view(view, view, (-300, -300, 300, 300))
+        self.assertEqual(self.tilemap.rows_left_view, [])
+        self.assertEqual(self.tilemap.rows_in_view, self.get_expected(*load))
+        self.tilemap.update_view(view)
+        self.assertEqual(
+            set(self.tilemap.rows_left_view), self.get_expected(*load) - self.get_expected(*view)
+        )
+
+    def get_view_rects(self, velocity):
+        window = MainWindowManager.__new__(MainWindowManager)
+        window.x, window.y = 0.0, 0.0
+        window.sprite_view_width, window.sprite_view_height = 200.0, 100.0
+        window.scroll_velocity = velocity
+        instances = MainWindowManager.instance, PlayerConf.instance
+        MainWindowManager.instance, PlayerConf.instance = window, PlayerConf()
+        try:
+            return self.tilemap.get_view_rects()
+        finally:
+            MainWindowManager.instance, PlayerConf.instance = instances
+
+    def test_view_rects_reach_ahead_of_scroll(self):
+        ahead = 300.0 * conf.tile_prefetch_time
+        view_rect, load_rect, keep_rect = self.get_view_rects((300.0, 0.0))
+        self.assertEqual(
+            (view_rect[0], view_rect[1], view_rect[2] + ahead, view_rect[3]), load_rect
+        )
+        view_rect, load_rect, keep_rect = self.get_view_rects((0.0, -300.0))
+        self.assertEqual(
+            (view_rect[0], view_rect[1] - ahead, view_rect[2], view_rect[3]), load_rect
+        )
+        self.assertTrue(keep_rect[0] <= load_rect[0] and keep_rect[1] <= load_rect[1])
+        self.assertTrue(keep_rect[2] >= load_rect[2] and keep_rect[3] >= load_rect[3])
+
+    def test_unchanged_view_is_not_queried(self):
+        view = (-100, -100, 100, 100)
+        self.tilemap.update_view(view)
+        self.assertTrue(self.tilemap.rows_entered_view)
+        self.tilemap.spatial_index = None
+        self.tilemap.update_view(view)
+        self.assertEqual([], self.tilemap.rows_entered_view)
+        self.assertEqual([], self.tilemap.rows_left_view)
+        self.assertEqual(self.tilemap.rows_in_view, self.get_expected(*view))
+
+    def test_rows_to_build(self):
+        view = (-100, -100, 100, 100)
+        load = (-100, -100, 300, 100)
+        self.tilemap.update_view(view, load)
+        self.assertEqual(
+            set(self.tilemap.get_rows_to_build(budget=-1)), self.get_expected(*view)
+        )
+        rows = list(self.tilemap.get_rows_to_build(budget=60))
+        self.assertEqual(set(rows), self.get_expected(*load))
+        distances = [
+            self.tilemap.tiles[row].x_pos**2 + self.tilemap.tiles[row].y_pos**2
+            for row in rows[len(self.get_expected(*view)):]
+        ]
+        self.assertEqual(distances, sorted(distances))
+
+
+class TestMapFile(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "map.ascmap")
+        self.tilemap = make_tilemap(28, 42)
+        random.seed(4)
+        for tile in self.tilemap.tiles:
+            tile.terrain = random.choice(TERRAINS)
+            tile.explored = random.random() < 0.2
+        self.tilemap.gettile(-2, 5).locale = "village"
+        self.tilemap.calc_overlay_masks()
+        self.reveal_map = conf.reveal_map
+        conf.instance.reveal_map = False
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        conf.instance.reveal_map = self.reveal_map
+        TileMap.instance = None
+
+    def load(self):
+        loaded = TileMap.__new__(TileMap)
+        loaded.reset_tiles()
+        loaded.load_tiles(self.path)
+        return loaded
+
+    def test_save_and_load(self):
+        self.tilemap.save(self.path)
+        loaded = self.load()
+        self.assertEqual((28, 42), (loaded.width, loaded.height))
+        for name in ["x", "y", "x_pos", "y_pos", "terrain", "locale", "explored", "edged",
+                     "bunch_center_x", "bunch_center_y", "neighbors", "sea_mask",
+                     "sea_border_mask"]:
+            self.assertTrue(
+                (getattr(loaded.store, name) == getattr(self.tilemap.store, name)).all(), name
+            )
+        self.assertEqual("village", loaded.gettile(-2, 5).locale)
+
+    def test_save_exploration(self):
+        self.tilemap.save(self.path)
+        size = os.path.getsize(self.path)
+        TileMap.instance = self.tilemap
+        self.tilemap.gettile(3, 4).explore((3, 3))
+        self.tilemap.gettile(3, 5).edge()
+        self.tilemap.save_exploration()
+        self.assertEqual(size, os.path.getsize(self.path))
+        map_file = MapFile(self.path, mode="r")
+        self.assertTrue(
+            numpy.array_equal(map_file.columns["explored"], self.tilemap.store.explored)
+        )
+        self.assertTrue(numpy.array_equal(map_file.columns["edged"], self.tilemap.store.edged))
+
+    def test_not_a_map_file(self):
+        with open(self.path, "wb") as f:
+            f.write("not a map")
+        with self.assertRaises(MapFileError):
+            MapFile(self.path)
+
+    def test_save_over_loaded_map(self):
+        self.tilemap.save(self.path)
+        loaded = self.load()
+        loaded.gettile(0, 0).terrain = "mountain"
+        loaded.save(self.path)
+        self.assertEqual(["map.ascmap"], os.listdir(self.directory))
+        self.assertEqual("mountain", self.load().gettile(0, 0).terrain)
+
+    def test_truncated_map_file(self):
+        self.tilemap.save(self.path)
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 8)
+        with self.assertRaises(MapFileError):
+            MapFile(self.path)
+
+    def test_map_file_count_mismatch(self):
+        self.tilemap.save(self.path)
+        header = numpy.fromfile(self.path, dtype=HEADER_DTYPE, count=1)
+        header["width"] = 14
+        with open(self.path, "r+b") as f:
+            header.tofile(f)
+        with self.assertRaises(MapFileError):
+            MapFile(self.path)
+
+    def test_load_reveals_map(self):
+        self.tilemap.save(self.path)
+        conf.instance.reveal_map = True
+        loaded = self.load()
+        self.assertTrue(loaded.store.explored.all())
+        self.assertTrue(loaded.store.edged.all())
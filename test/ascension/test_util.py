@@ -0,0 +1,24 @@
+from unittest2 import TestCase
+
+from ascension.util import OrderedSet
+
+
+class TestOrderedSet(TestCase):
+
+    def test_insertion_order(self):
+        items = OrderedSet([3, 1, 2])
+        items.add(1)
+        items.add(0)
+        self.assertEqual(list(items), [3, 1, 2, 0])
+        self.assertEqual(len(items), 4)
+
+    def test_remove(self):
+        items = OrderedSet(range(5))
+        items.remove(2)
+        items.discard(4)
+        items.discard(10)
+        self.assertEqual(list(items), [0, 1, 3])
+        self.assertNotIn(2, items)
+        self.assertIn(3, items)
+        with self.assertRaises(KeyError):
+            items.remove(2)
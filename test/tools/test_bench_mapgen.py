@@ -0,0 +1,29 @@
+from unittest2 import TestCase
+import random
+
+from ascension.tilemap import TileMap
+from tools.bench_mapgen import generate, run_size
+
+
+class TestBenchMapgen(TestCase):
+
+    def test_generate_matches_assign_terrain(self):
+        tilemap, phase_seconds = generate(28, 42, seed=7)
+        expected = TileMap()
+        random.seed(7)
+        expected.generate_square(width=28, height=42)
+        expected.determine_outer_limits()
+        expected.assign_terrain()
+        self.assertTrue((tilemap.store.terrain == expected.store.terrain).all())
+        self.assertEqual("generate_square", phase_seconds.keys()[0])
+        self.assertEqual("setup_visibility", phase_seconds.keys()[-1])
+
+    def test_generate_checks_map_size(self):
+        with self.assertRaises(Exception):
+            generate(20, 28)
+
+    def test_run_size(self):
+        report = run_size((14, 28))
+        self.assertEqual(392, report["tiles"])
+        self.assertEqual(392, sum(report["terrain_counts"].values()))
+        self.assertGreaterEqual(report["peak_rss_kb"], report["start_rss_kb"])
@@ -0,0 +1,155 @@
+from unittest2 import TestCase
+import json
+import os
+import shutil
+import tempfile
+
+
+from PIL import Image
+from sprite.component import SpriteComponent
+
+
+from tools.make_atlas import shade_edges, AtlasGenerator
+
+
+SHADE = (0, 0, 0, 50)
+CLEAR = (0, 0, 0, 0)
+RED = (255, 0, 0, 255)
+
+
+class TestShadeEdges(TestCase):
+
+    def make_component(self, rows):
+        image = Image.new("RGBA", (len(rows[0]), len(rows)))
+        image.putdata([pixel for row in rows for pixel in row])
+        return SpriteComponent(name="test", image=image)
+
+    def get_rows(self, component):
+        width, height = component.image.size
+        pixels = list(component.image.getdata())
+        return [pixels[y*width:(y+1)*width] for y in range(height)]
+
+    def test_shade_all_sides(self):
+        component = shade_edges(self.make_component([[RED]]))
+        self.assertEqual(self.get_rows(component), [
+            [CLEAR, SHADE, CLEAR],
+            [SHADE, RED, SHADE],
+            [CLEAR, SHADE, CLEAR],
+        ])
+        self.assertTrue(component.anchor_x_slide_1)
+        self.assertTrue(component.anchor_y_slide_1)
+
+    def test_crop_unshaded_sides(self):
+        component = shade_edges(self.make_component([
+            [CLEAR, CLEAR],
+            [CLEAR, RED],
+        ]))
+        self.assertEqual(self.get_rows(component), [
+            [CLEAR, SHADE, CLEAR],
+            [SHADE, RED, SHADE],
+            [CLEAR, SHADE, CLEAR],
+        ])
+        self.assertFalse(component.anchor_x_slide_1)
+        self.assertFalse(component.anchor_y_slide_1)
+
+
+BLUE = (0, 0, 255, 255)
+GREEN = (0, 255, 0, 255)
+
+
+class RecordingAtlasGenerator(AtlasGenerator):
+    repacked = False
+
+    def generate_atlas(self):
+        self.repacked = True
+        super(RecordingAtlasGenerator, self).generate_atlas()
+
+
+class TestIncrementalAtlas(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.directory, "source", "misc")
+        os.makedirs(self.source_dir)
+        img_dir = os.path.join(self.directory, "img")
+        x2_dir = os.path.join(img_dir, "x2")
+        x3_dir = os.path.join(img_dir, "x3")
+        self.generator_class = type("TestAtlasGenerator", (RecordingAtlasGenerator,), {
+            "img_dir": img_dir,
+            "x2_dir": x2_dir,
+            "x3_dir": x3_dir,
+            "meta_file_name": os.path.join(img_dir, "ASCENSION_ATLAS_META.json"),
+            "img_file_name": os.path.join(img_dir, "ASCENSION_ATLAS.png"),
+            "x2_img_file_name": os.path.join(x2_dir, "ASCENSION_ATLAS.png"),
+            "x3_img_file_name": os.path.join(x3_dir, "ASCENSION_ATLAS.png"),
+            "manifest_file_name": os.path.join(img_dir, "ASCENSION_ATLAS_MANIFEST.json"),
+        })
+        self.save_source("red", (4, 3), RED)
+        self.save_source("blue", (5, 2), BLUE)
+        self.save_meta("animations: []\n")
+        self.build()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save_source(self, name, size, color):
+        Image.new("RGBA", size, color).save(os.path.join(self.source_dir, name + ".png"))
+
+    def save_meta(self, text):
+        with open(os.path.join(self.source_dir, "meta.yaml"), "w") as f:
+            f.write(text)
+
+    def build(self):
+        return self.generator_class.make_atlas(os.path.join(self.directory, "source"))
+
+    def get_meta(self, name):
+        with open(self.generator_class.meta_file_name) as f:
+            components = json.load(f)["components"]
+        return [c for c in components if c["name"] == name][0]
+
+    def test_unchanged_rebuild_uses_cache(self):
+        generator = self.build()
+        self.assertEqual(set(), generator.changed_components)
+        self.assertFalse(generator.repacked)
+
+    def test_changed_component_pasted_at_meta_position(self):
+        self.save_source("red", (4, 3), GREEN)
+        generator = self.build()
+        self.assertEqual(set(["misc.red"]), generator.changed_components)
+        self.assertFalse(generator.repacked)
+        meta = self.get_meta("misc.red")
+        atlas_image = Image.open(self.generator_class.img_file_name)
+        self.assertEqual(GREEN, atlas_image.getpixel((meta["x"], meta["y"])))
+        x3_image = Image.open(self.generator_class.x3_img_file_name)
+        self.assertEqual(GREEN, x3_image.getpixel((meta["x"] * 3, meta["y"] * 3)))
+
+    def test_layout_change_repacks(self):
+        self.save_source("red", (6, 3), RED)
+        generator = self.build()
+        self.assertTrue(generator.repacked)
+        self.assertEqual(6, self.get_meta("misc.red")["width"])
+
+    def test_meta_file_change_repacks(self):
+        self.save_meta("animations: []\nfeature_maps: []\n")
+        self.assertTrue(self.build().repacked)
+
+    def test_removed_component_images_deleted(self):
+        os.remove(os.path.join(self.source_dir, "blue.png"))
+        generator = self.build()
+        self.assertTrue(generator.repacked)
+        for path in generator.get_image_paths("misc.blue"):
+            self.assertFalse(os.path.exists(path))
+        for path in generator.get_image_paths("misc.red"):
+            self.assertTrue(os.path.isfile(path))
+
+    def test_interrupted_build_rebuilds_everything(self):
+        os.remove(self.generator_class.manifest_file_name)
+        generator = self.build()
+        self.assertEqual(set(["misc.red", "misc.blue"]), generator.changed_components)
+        self.assertTrue(generator.repacked)
+
+    def test_missing_scaled_atlas_restored(self):
+        os.remove(self.generator_class.x2_img_file_name)
+        generator = self.build()
+        self.assertFalse(generator.repacked)
+        self.assertTrue(os.path.isfile(self.generator_class.x2_img_file_name))
@@ -1,13 +1,22 @@
 from unittest2 import TestCase
 from decimal import Decimal, getcontext
 import math
+import random
+import shutil
+import signal
+import tempfile
+
+
+import numpy
 
 
 from tools.util import (
     line_gt, line_gtoe, line_lt, line_ltoe, get_line_intersection,
     get_line_through_point, line_eq, get_distance_to_line_segment,
-    get_distance_to_line,
+    get_distance_to_line, FrameGenerator, TerrainGenerator, is_in_hex, get_topleft_tile_point,
+    TerrainGeneratorError,
 )
+from ascension.settings import AscensionConf as conf
 
 
 class TestLine(TestCase):
@@ -167,5 +176,135 @@ class TestLine(TestCase):
         self.assertAlmostEquals(expected, actual)
 
 
+class TestFrameGenerator(TestCase):
+    color_map = [
+        (Decimal('0.2'), (2, 5, 74)),
+        (Decimal('0.2'), (2, 4, 82)),
+        (Decimal('0.4'), (2, 2, 90)),
+        (Decimal('0.1'), (3, 5, 115)),
+        (Decimal('0.1'), (3, 8, 140)),
+    ]
+
+    def get_ranked_colors(self, values):
+        # Walk every pixel from the highest value down, one at a time
+        width, height = values.shape
+        total_pixels = Decimal(width * height)
+        points = sorted((values[x, y], (x, y)) for x in range(width) for y in range(height))
+        color_map = list(self.color_map)
+        colors = {}
+        threshhold, color = color_map.pop()
+        for i in range(len(points)):
+            colors[points[-(i+1)][1]] = color
+            if (i+1) / total_pixels > threshhold:
+                new_threshhold, color = color_map.pop()
+                threshhold += new_threshhold
+        return colors
+
+    def draw(self, values):
+        width, height = values.shape
+        frame_generator = FrameGenerator(self.color_map, [], width, height, 0)
+        frame_generator.add_values(0, values[:, :4])
+        frame_generator.add_values(4, values[:, 4:])
+        frame_generator.draw_image()
+        return frame_generator
+
+    def test_draw_image_matches_ranking(self):
+        random.seed(5)
+        values = numpy.array([[random.random() for _ in range(9)] for _ in range(13)])
+        frame_generator = self.draw(values)
+        for (x, y), color in self.get_ranked_colors(values).items():
+            self.assertEqual(frame_generator.pixels[x, y], color)
+
+    def test_draw_image_ties(self):
+        values = numpy.array([[(x * 7 + y * 3) % 4 for y in range(10)] for x in range(10)])
+        frame_generator = self.draw(values.astype(float))
+        for (x, y), color in self.get_ranked_colors(values).items():
+            self.assertEqual(frame_generator.pixels[x, y], color)
+
+
+class TestCutHex(TestCase):
+    border = [(0, 0, 0, 1), ((0, 0, 0, 0.2), (255, 255, 255, 0.2)), (40, 80, 120, 0.5)]
+
+    def shade_color(self, color, shader):
+        # The per pixel blend cut_hex used before the shading was precomputed
+        shader_alpha = shader[3]
+        return tuple([
+            int(color[k] + shader_alpha * (shader[k] - color[k])) for k in range(3)
+        ]) + (255,)
+
+    def get_expected_hex(self, generator, frame, topleft_x, topleft_y):
+        pixels = {}
+        for x in range(conf.tile_width):
+            for y in range(conf.tile_height):
+                if not is_in_hex(x, y):
+                    pixels[x, y] = (0, 0, 0, 0)
+                    continue
+                frame_x = (x + topleft_x) % conf.frame_width
+                frame_y = (y + topleft_y) % conf.frame_height
+                color = tuple(frame[frame_y, frame_x]) + (255,)
+                border_level = generator.get_border_level(x, y)
+                if border_level < len(self.border):
+                    border_color = self.border[border_level]
+                    if len(border_color) == 2:
+                        border_color = border_color[y*2 / conf.tile_height > 0 and 1 or 0]
+                    color = self.shade_color(color, border_color)
+                pixels[x, y] = color
+        return pixels
+
+    def test_cut_hex_matches_per_pixel_shading(self):
+        generator = TerrainGenerator(perlin_setup=[], border=self.border)
+        generator.make_border_map()
+        generator.make_hex_shading()
+        random.seed(6)
+        frame = numpy.array([
+            [[random.randrange(256) for _ in range(3)] for _ in range(conf.frame_width)]
+            for _ in range(conf.frame_height)
+        ], dtype=numpy.uint8)
+        for i, j in [(0, 0), (1, 0), (1, 1)]:
+            topleft_x, topleft_y = get_topleft_tile_point(i, j)
+            hex_pixels = generator.cut_hex(frame, topleft_x, topleft_y).load()
+            expected = self.get_expected_hex(generator, frame, topleft_x, topleft_y)
+            for (x, y), color in expected.items():
+                self.assertEqual(color, hex_pixels[x, y], (i, j, x, y))
+
+
+class FailingSaveGenerator(TerrainGenerator):
+    saves = 0
+
+    def save_frame(self, framenum, frame_image):
+        self.saves += 1
+        if self.saves == self.animation_frame_count:
+            raise IOError("disk full")
+        super(FailingSaveGenerator, self).save_frame(framenum, frame_image)
+
+
+class TestTerrainGeneratorPool(TestCase):
+
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        self.sigint_handler = signal.getsignal(signal.SIGINT)
+        self.find_row_values = FrameGenerator.find_row_values
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+        signal.signal(signal.SIGINT, self.sigint_handler)
+        FrameGenerator.find_row_values = self.find_row_values
+
+    def make_generator(self, cls=TerrainGenerator):
+        return cls(
+            perlin_setup=[], outdir=self.outdir, group_name="test", color_map=[(1, (1, 2, 3))],
+            progress_bar_sleep=0.01, worker_count=2, animation_frame_count=2,
+        )
 
+    def test_worker_failure(self):
+        def fail(frame_generator, y_start, y_stop):
+            raise RuntimeError("worker failed")
+        FrameGenerator.find_row_values = fail
+        with self.assertRaises(TerrainGeneratorError):
+            self.make_generator().start()
 
+    def test_last_frame_save_failure(self):
+        generator = self.make_generator(FailingSaveGenerator)
+        with self.assertRaises(TerrainGeneratorError):
+            generator.start()
+        self.assertEqual(2, generator.saves)
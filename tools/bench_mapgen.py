@@ -0,0 +1,144 @@
+"""
+Headless benchmark of map generation. Runs the phases of TileMap.generate_map, without the
+sprite masters, for maps of increasing size, each size in a fresh process, and writes the
+seconds spent in each phase and the peak memory of each run as a JSON report that can be
+compared with the report of another commit.
+"""
+import json
+import platform
+import random
+import resource
+import subprocess
+import time
+from collections import OrderedDict
+from functools import partial
+from multiprocessing import Pool
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from ascension.tilemap import TileMap, TERRAINS
+
+
+SIZES = [14, 28, 56, 112, 224, 448, 700, 1400]
+
+
+def get_phases(tilemap, width, height):
+    """
+    The steps of generate_map after create_sprite_masters. assign_mountains and assign_forests
+    are its assign_terrain_perlin passes.
+    """
+    return [
+        ("generate_square", partial(tilemap.generate_square, width=width, height=height)),
+        ("determine_outer_limits", tilemap.determine_outer_limits),
+        ("assign_sea", tilemap.assign_sea),
+        ("assign_mountains", tilemap.assign_mountains),
+        ("assign_forests", tilemap.assign_forests),
+        ("assign_village", tilemap.assign_village),
+        ("calc_overlay_masks", tilemap.calc_overlay_masks),
+        ("setup_visibility", tilemap.setup_visibility),
+    ]
+
+
+def get_peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def generate(width, height, seed=111):
+    """ Generates a map phase by phase, returning the TileMap and the seconds of each phase """
+    tilemap = TileMap()
+    tilemap.check_map_size(width, height)
+    random.seed(seed)
+    phase_seconds = OrderedDict()
+    for name, phase in get_phases(tilemap, width, height):
+        start = time.time()
+        phase()
+        phase_seconds[name] = time.time() - start
+    return tilemap, phase_seconds
+
+
+def run_size(size, seed=111):
+    width, height = size
+    start_rss_kb = get_peak_rss_kb()
+    tilemap, phase_seconds = generate(width, height, seed=seed)
+    terrain_counts = OrderedDict([
+        (terrain, int((tilemap.store.terrain == code).sum()))
+        for code, terrain in enumerate(TERRAINS)
+    ])
+    return OrderedDict([
+        ("width", width),
+        ("height", height),
+        ("tiles", tilemap.count),
+        ("phases", phase_seconds),
+        ("total_seconds", sum(phase_seconds.values())),
+        ("start_rss_kb", start_rss_kb),
+        ("peak_rss_kb", get_peak_rss_kb()),
+        ("terrain_counts", terrain_counts),
+    ])
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"]).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, seed=111):
+    # A new process per size so each peak_rss_kb only covers that map
+    pool = Pool(processes=1, maxtasksperchild=1)
+    try:
+        runs = pool.map(partial(run_size, seed=seed), [(size, size) for size in sizes], 1)
+    finally:
+        pool.close()
+        pool.join()
+    return OrderedDict([
+        ("commit", get_commit()),
+        ("python", platform.python_version()),
+        ("seed", seed),
+        ("runs", runs),
+    ])
+
+
+def print_report(report):
+    for run in report["runs"]:
+        print "{}x{}: {:.3f}s, peak {} kB".format(
+            run["width"], run["height"], run["total_seconds"], run["peak_rss_kb"]
+        )
+        for name, seconds in run["phases"].items():
+            print "  {:<24} {:9.3f}s".format(name, seconds)
+
+
+def print_comparison(old_report, new_report):
+    old_runs = dict([((run["width"], run["height"]), run) for run in old_report["runs"]])
+    print "{} -> {}".format(old_report["commit"], new_report["commit"])
+    for new_run in new_report["runs"]:
+        old_run = old_runs.get((new_run["width"], new_run["height"]))
+        if not old_run:
+            continue
+        print "{}x{}: peak {} -> {} kB".format(
+            new_run["width"], new_run["height"], old_run["peak_rss_kb"], new_run["peak_rss_kb"]
+        )
+        old_seconds = dict(old_run["phases"], total=old_run["total_seconds"])
+        for name, seconds in new_run["phases"].items() + [("total", new_run["total_seconds"])]:
+            if name not in old_seconds:
+                continue
+            print "  {:<24} {:9.3f}s {:9.3f}s {:7.2f}x".format(
+                name, old_seconds[name], seconds, old_seconds[name] / max(seconds, 1e-9)
+            )
+
+
+def main(sizes=SIZES, seed=111, output=None, compare=None):
+    report = run(sizes=sizes, seed=seed)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2, separators=(",", ": "))
+    print_report(report)
+    if compare:
+        with open(compare) as f:
+            print_comparison(json.load(f, object_pairs_hook=OrderedDict), report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the transition engines. Starts one engine on each of a number of sprites
+and times the ticks the way SpriteManager.tick runs them, to give the cost of one engine of
+each kind per tick.
+"""
+import time
+
+from ascension import ascsprite
+from ascension.ascsprite import BaseSprite, Sprite, AscAnimationPlayer
+
+
+ENGINE_KINDS = ["delay", "move", "fade", "animation"]
+TIME_PASSED = 0.001
+
+
+class BenchStage(object):
+
+    def __init__(self, duration):
+        self.duration = duration
+
+    def update_renderer(self, sprite):
+        pass
+
+
+class BenchAnimation(object):
+
+    def __init__(self, stage_count, stage_duration):
+        self.stages = [BenchStage(stage_duration) for _ in range(stage_count)]
+
+
+def start_engine(sprite, kind, ticks):
+    if kind == "delay":
+        sprite.static_delay(ticks)
+    elif kind == "move":
+        sprite.move_to((ticks, ticks), 1)
+    elif kind == "fade":
+        sprite.fade(start_alpha=255, finish_alpha=0, duration=1)
+    elif kind == "animation":
+        player = AscAnimationPlayer(sprite, BenchAnimation(ticks, TIME_PASSED * 3))
+        sprite.add_transition_engine(player)
+        player.start()
+    else:
+        raise ValueError("Unknown engine kind '{}'".format(kind))
+
+
+def run_ticks(sprites, ticks):
+    runtime = getattr(ascsprite, "TransitionRuntime", None)
+    start = time.time()
+    for _ in range(ticks):
+        if runtime:
+            runtime.step(TIME_PASSED)
+        for sprite in sprites:
+            BaseSprite.tick(sprite, TIME_PASSED)
+    return time.time() - start
+
+
+def bench_engine(kind, engine_count, ticks):
+    runtime = getattr(ascsprite, "TransitionRuntime", None)
+    if runtime:
+        runtime.reset()
+    sprites = [Sprite(x=0, y=0) for _ in range(engine_count)]
+    for sprite in sprites:
+        start_engine(sprite, kind, ticks)
+    seconds = run_ticks(sprites, ticks)
+    return seconds / (engine_count * ticks)
+
+
+def main(engine_count=1000, ticks=100):
+    print "{} engines, {} ticks".format(engine_count, ticks)
+    for kind in ENGINE_KINDS:
+        per_engine = bench_engine(kind, engine_count, ticks)
+        print "  {:<10} {:8.3f} us per engine per tick".format(kind, per_engine * 1e6)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,14 @@ import sys
 import os
 import json
 import yaml
-import shutil
+import hashlib
+from multiprocessing import Pool
 from sprite.atlas import Atlas
 from sprite.component import SpriteComponent
-from ascension.ascsprite import AscAnimation
+from ascension.ascsprite import AscAnimation, dump_atlas_meta, get_atlas_meta_sidecar
+from ascension.settings import IMG_DIR, ATLAS_IMAGE_NAME, get_scaled_img_dir
 from PIL import Image
+import numpy
 
 class AscensionAtlas(Atlas):
 
@@ -54,42 +57,171 @@ def remove_extension(filepath):
     return ".".join(filepath.split(".")[:-1])
 
 
+def get_file_hash(filepath, *extra):
+    file_hash = hashlib.sha1()
+    for value in extra:
+        file_hash.update(value)
+    with open(filepath, "rb") as f:
+        file_hash.update(f.read())
+    return file_hash.hexdigest()
+
+
+def use_dir(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+
+def load_component(task):
+    """ Run one AtlasGenerator loader, returns what load_components needs to rebuild it """
+    name, image_path, tokens, load_image_func_name = task
+    generator = AtlasGenerator([])
+    generator.components = {}
+    generator.extra_component_meta = {}
+    getattr(generator, load_image_func_name)(image_path, tokens)
+    component = generator.components[name]
+    return (
+        name, component.image, generator.extra_component_meta[name],
+        getattr(component, "anchor_x_slide_1", False),
+        getattr(component, "anchor_y_slide_1", False),
+    )
+
+
+def save_component_images(task):
+    image, filepath, x2_filepath, x3_filepath = task
+    image.save(filepath, format="PNG")
+    width, height = image.size
+    x2_image = image.resize((width*2, height*2))
+    x2_image.save(x2_filepath, format="PNG")
+    x3_image = image.resize((width*3, height*3))
+    x3_image.save(x3_filepath, format="PNG")
+
+
 class AtlasGenerator(object):
     load_map = {
         ("unit",): "load_unit_image",
         ("terrain", "features"): "load_feature_image",
         ("locale",): "load_feature_image",
     }
-    data_dir = "data"
-    img_dir = os.path.join(data_dir, "img")
-    x2_dir = os.path.join(img_dir, "x2")
-    x3_dir = os.path.join(img_dir, "x3")
+    img_dir = IMG_DIR
+    x2_dir = get_scaled_img_dir(2)
+    x3_dir = get_scaled_img_dir(3)
+    meta_file_name = os.path.join(img_dir, "ASCENSION_ATLAS_META.json")
+    img_file_name = os.path.join(img_dir, ATLAS_IMAGE_NAME)
+    x2_img_file_name = os.path.join(x2_dir, ATLAS_IMAGE_NAME)
+    x3_img_file_name = os.path.join(x3_dir, ATLAS_IMAGE_NAME)
+    manifest_file_name = os.path.join(img_dir, "ASCENSION_ATLAS_MANIFEST.json")
+    manifest_version = 1
 
     @classmethod
-    def make_atlas(cls, *base_directories):
-        inst = cls(base_directories)
-        inst.load_images()
-        inst.generate_atlas()
-        if os.path.isdir(cls.img_dir):
-            shutil.rmtree(cls.img_dir)
-        os.mkdir(cls.img_dir)
-        os.mkdir(cls.x2_dir)
-        os.mkdir(cls.x3_dir)
-        inst.save_all_images()
-        inst.save_atlas()
-
-    def __init__(self, base_directories):
+    def make_atlas(cls, *base_directories, **kwargs):
+        inst = cls(base_directories, **kwargs)
+        try:
+            inst.load_manifest()
+            inst.load_images()
+            inst.remove_manifest()
+            use_dir(cls.img_dir)
+            use_dir(cls.x2_dir)
+            use_dir(cls.x3_dir)
+            inst.save_all_images()
+            inst.save_atlas()
+            inst.save_manifest()
+        finally:
+            inst.close_pool()
+        return inst
+
+    def __init__(self, base_directories, jobs=1):
         self.base_directories = base_directories
+        self.jobs = jobs
+        self.pool = None
+
+    def map(self, func, tasks):
+        """
+        Map over tasks in a process pool when jobs is above 1. Results always come back in
+        task order, so the build output does not depend on the number of jobs.
+        """
+        if self.jobs <= 1 or len(tasks) <= 1:
+            return map(func, tasks)
+        if not self.pool:
+            self.pool = Pool(processes=self.jobs)
+        return self.pool.map(func, tasks, chunksize=1)
+
+    def close_pool(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def load_manifest(self):
+        """
+        The manifest records a content hash for every source image and meta file of the last
+        build, so that unchanged components are loaded back from img_dir instead of being
+        shaded and scaled again.
+        """
+        self.manifest = {}
+        if os.path.isfile(self.manifest_file_name):
+            with open(self.manifest_file_name) as f:
+                self.manifest = json.load(f)
+        if self.manifest.get("version") != self.manifest_version:
+            self.manifest = {"version": self.manifest_version, "components": {}}
+
+    def remove_manifest(self):
+        # Written again once the build is done, a half finished build starts from scratch
+        if os.path.isfile(self.manifest_file_name):
+            os.remove(self.manifest_file_name)
+
+    def save_manifest(self):
+        manifest = {
+            "version": self.manifest_version,
+            "components": self.component_manifest,
+            "meta_files": self.meta_file_hashes,
+            "layout": self.get_layout(),
+        }
+        with open(self.manifest_file_name, "w") as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+
+    def get_layout(self):
+        layout = {}
+        for name, component in self.components.items():
+            entry = self.component_manifest[name]
+            layout[name] = [
+                component.image.width, component.image.height, entry["center_x"],
+                entry["center_y"], entry["anchor_x_slide_1"], entry["anchor_y_slide_1"],
+            ]
+        return layout
 
     def load_images(self):
         self.components = {}
         self.extra_component_meta = {}
         self.animations = []
         self.feature_maps = []
+        self.component_manifest = {}
+        self.meta_file_hashes = {}
+        self.changed_components = set()
+        self.component_tasks = []
         for directory in self.base_directories:
             self.load_image_dir(directory)
+        self.load_components()
         self.update_extra_component_meta()
 
+    def load_components(self):
+        tasks = [task for task, _ in self.component_tasks]
+        source_hashes = dict([(task[0], source_hash) for task, source_hash in self.component_tasks])
+        for result in self.map(load_component, tasks):
+            name, image, center_meta, anchor_x_slide_1, anchor_y_slide_1 = result
+            component = SpriteComponent(name=name, image=image)
+            component.anchor_x_slide_1 = anchor_x_slide_1
+            component.anchor_y_slide_1 = anchor_y_slide_1
+            self.add_extra_component_meta(name, center_meta)
+            self.components[name] = component
+            self.changed_components.add(name)
+            self.component_manifest[name] = {
+                "hash": source_hashes[name],
+                "center_x": center_meta["center_x"],
+                "center_y": center_meta["center_y"],
+                "anchor_x_slide_1": anchor_x_slide_1,
+                "anchor_y_slide_1": anchor_y_slide_1,
+            }
+
     def update_extra_component_meta(self):
         for component_name, extra_meta in self.extra_component_meta.items():
             component = self.components[component_name]
@@ -115,29 +247,74 @@ class AtlasGenerator(object):
         for feature_map in self.feature_maps:
             self.atlas.add_feature_map(feature_map)
 
-    def save_all_images(self):
-        for component_name, component in self.atlas.components.items():
-            filename = "{}.png".format(component_name)
-            filepath = os.path.join(self.img_dir, filename)
-            x2_filepath = os.path.join(self.x2_dir, filename)
-            x3_filepath = os.path.join(self.x3_dir, filename)
-            component.image.save(filepath, format="PNG")
-            width, height = component.image.width, component.image.height
-            x2_image = component.image.resize((width*2, height*2))
-            x2_image.save(x2_filepath, format="PNG")
-            x3_image = component.image.resize((width*3, height*3))
-            x3_image.save(x3_filepath, format="PNG")
+    def get_image_paths(self, component_name):
+        filename = "{}.png".format(component_name)
+        return [os.path.join(d, filename) for d in (self.img_dir, self.x2_dir, self.x3_dir)]
 
+    def save_all_images(self):
+        tasks = []
+        for component_name in sorted(self.changed_components):
+            image = self.components[component_name].image
+            tasks.append(tuple([image] + self.get_image_paths(component_name)))
+        self.map(save_component_images, tasks)
+        for component_name in self.manifest["components"]:
+            if component_name not in self.components:
+                for filepath in self.get_image_paths(component_name):
+                    if os.path.isfile(filepath):
+                        os.remove(filepath)
+        print "{} of {} components rebuilt".format(
+            len(self.changed_components), len(self.components)
+        )
 
     def save_atlas(self):
-        meta_file_name = os.path.join(self.img_dir, "ASCENSION_ATLAS_META.json")
-        img_file_name = os.path.join(self.img_dir, "ASCENSION_ATLAS.png")
-        with open(meta_file_name, "w") as f:
-            json.dump(self.atlas.get_meta(), f, indent=4)
-        self.atlas.dump_atlas(img_file_name)
+        """
+        Pack the atlas again only if a component was added, removed, or changed size or
+        anchors, or if a meta file changed. When only the pixels of some components changed,
+        they are pasted over their old place in the existing atlas image.
+        """
+        unchanged = (
+                os.path.isfile(self.meta_file_name)
+            and os.path.isfile(get_atlas_meta_sidecar(self.meta_file_name))
+            and os.path.isfile(self.img_file_name)
+            and self.manifest.get("layout") == self.get_layout()
+            and self.manifest.get("meta_files") == self.meta_file_hashes
+        )
+        if not unchanged:
+            self.generate_atlas()
+            dump_atlas_meta(self.atlas.get_meta(), self.meta_file_name)
+            self.atlas.dump_atlas(self.img_file_name)
+        elif self.changed_components:
+            self.update_atlas_image()
+        scaled_files = [self.x2_img_file_name, self.x3_img_file_name]
+        if (
+                not unchanged
+            or self.changed_components
+            or not all([os.path.isfile(path) for path in scaled_files])
+        ):
+            self.save_scaled_atlas()
+
+    def save_scaled_atlas(self):
+        # The game loads the atlas at its sprite scale, same as the scaled component images
+        atlas_image = Image.open(self.img_file_name)
+        width, height = atlas_image.size
+        x2_image = atlas_image.resize((width*2, height*2))
+        x2_image.save(self.x2_img_file_name, format="PNG")
+        x3_image = atlas_image.resize((width*3, height*3))
+        x3_image.save(self.x3_img_file_name, format="PNG")
+
+    def update_atlas_image(self):
+        with open(self.meta_file_name) as f:
+            components_meta = json.load(f)["components"]
+        atlas_image = Image.open(self.img_file_name)
+        atlas_image.load()
+        for component_meta in components_meta:
+            if component_meta["name"] in self.changed_components:
+                component = self.components[component_meta["name"]]
+                atlas_image.paste(component.image, (component_meta["x"], component_meta["y"]))
+        atlas_image.save(self.img_file_name, format="PNG")
 
     def load_image_dir(self, directory, tokens=[]):
-        for tail in os.listdir(directory):
+        for tail in sorted(os.listdir(directory)):
             if "DS_Store" in tail:
                 continue
             path = os.path.join(directory, tail)
@@ -157,9 +334,35 @@ class AtlasGenerator(object):
             if load_image_func_name:
                 load_image_func = getattr(self, load_image_func_name)
             tokens_temp.pop()
-        (load_image_func or self.load_image_default)(image_path, tokens)
+        load_image_func = load_image_func or self.load_image_default
+        name = ".".join(tokens + [remove_extension(os.path.basename(image_path))])
+        source_hash = get_file_hash(image_path, load_image_func.__name__)
+        if not self.load_cached_image(name, source_hash):
+            task = (name, image_path, tokens, load_image_func.__name__)
+            self.component_tasks.append((task, source_hash))
+
+    def load_cached_image(self, name, source_hash):
+        entry = self.manifest["components"].get(name)
+        if not entry or entry["hash"] != source_hash:
+            return False
+        image_paths = self.get_image_paths(name)
+        if not all([os.path.isfile(path) for path in image_paths]):
+            return False
+        image = Image.open(image_paths[0])
+        image.load()
+        component = SpriteComponent(name=name, image=image)
+        component.anchor_x_slide_1 = entry["anchor_x_slide_1"]
+        component.anchor_y_slide_1 = entry["anchor_y_slide_1"]
+        self.add_extra_component_meta(name, {
+            "center_x": entry["center_x"],
+            "center_y": entry["center_y"],
+        })
+        self.components[name] = component
+        self.component_manifest[name] = entry
+        return True
 
     def load_extra_meta(self, meta_path, tokens):
+        self.meta_file_hashes[meta_path] = get_file_hash(meta_path)
         with open(meta_path) as f:
             data = yaml.load(f)
         extra_component_meta = data.get("components", [])
@@ -217,45 +420,40 @@ class AtlasGenerator(object):
             self.extra_component_meta[component_name][key] = value
 
 
-def adjacent(img, x, y):
-    for i, j in (x+1, y), (x-1, y), (x, y+1), (x, y-1):
-        if 0 <= i < img.size[0] and 0 <= j < img.size[1]:
-            yield img.getpixel((i, j))
+def get_adjacent_mask(mask):
+    adjacent = numpy.zeros(mask.shape, dtype=bool)
+    adjacent[1:, :] |= mask[:-1, :]
+    adjacent[:-1, :] |= mask[1:, :]
+    adjacent[:, 1:] |= mask[:, :-1]
+    adjacent[:, :-1] |= mask[:, 1:]
+    return adjacent
 
 
 def shade_edges(base_component, shade_a=50):
     newimg = Image.new("RGBA", [a+2 for a in base_component.image.size], (0, 0, 0, 0))
-    arr = newimg.load()
     newimg.paste(base_component.image, (1, 1))
-    width, height = newimg.size
-    anchor_x_slide_1 = False
-    anchor_y_slide_1 = False
-    for x in range(width):
-        for y in range(height):
-            r, g, b, a = newimg.getpixel((x, y))
-            if not a and [adj for adj in adjacent(newimg, x, y) if adj[3] == 255]:
-                arr[x, y] = (0, 0, 0, shade_a)
-    if not [x for x in range(newimg.size[0]) if newimg.getpixel((x, 0)) != (0, 0, 0, 0)]:
+    pixels = numpy.array(newimg)
+    alpha = pixels[..., 3]
+    pixels[(alpha == 0) & get_adjacent_mask(alpha == 255)] = (0, 0, 0, shade_a)
+    used = pixels.any(axis=2)
+    top, bottom, left, right = 0, used.shape[0], 0, used.shape[1]
+    if not used[top].any():
         # Added nothing to top, delete top row
-        newimg = newimg.crop((0, 1, newimg.size[0], newimg.size[1]))
-    else:
-        # Added top row, slide x values
-        anchor_y_slide_1 = True
-    if not [x for x in range(newimg.size[0]) if newimg.getpixel((x, newimg.size[1]-1)) != (0, 0, 0, 0)]:
+        top += 1
+    if not used[bottom-1].any():
         # Added nothing to bottom, delete bottom row
-        newimg = newimg.crop((0, 0, newimg.size[0], newimg.size[1]-1))
-    if not [y for y in range(newimg.size[1]) if newimg.getpixel((0, y)) != (0, 0, 0, 0)]:
+        bottom -= 1
+    if not used[top:bottom, left].any():
         # Added nothing to left, delete left column
-        newimg = newimg.crop((1, 0, newimg.size[0], newimg.size[1]))
-    else:
-        # Added left column, slide x values
-        anchor_x_slide_1 = True
-    if not [y for y in range(newimg.size[1]) if newimg.getpixel((newimg.size[0]-1, y)) != (0, 0, 0, 0)]:
+        left += 1
+    if not used[top:bottom, right-1].any():
         # Added nothing to right, delete right column
-        newimg = newimg.crop((0, 0, newimg.size[0]-1, newimg.size[1]))
+        right -= 1
+    newimg = Image.fromarray(pixels[top:bottom, left:right], "RGBA")
     component = SpriteComponent(name=base_component.name, image=newimg)
-    component.anchor_x_slide_1 = anchor_x_slide_1
-    component.anchor_y_slide_1 = anchor_y_slide_1
+    # Kept the added top row or left column, slide anchor values
+    component.anchor_x_slide_1 = not left
+    component.anchor_y_slide_1 = not top
     return component
 
 
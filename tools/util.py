@@ -1,15 +1,18 @@
 import sys
+import logging
 import random
 import os
 import shutil
 import signal
 import time
 import math
+import traceback
 from threading import Thread
-from decimal import Decimal, getcontext
+from multiprocessing import Pool, Value, cpu_count
+from decimal import Decimal, Context, getcontext, setcontext
 
 
-from sortedcontainers import SortedList
+import numpy
 import yaml
 from PIL import Image
 
@@ -18,6 +21,9 @@ from ascension.perlin import TileablePerlinGenerator
 from ascension.settings import AscensionConf as conf
 
 
+LOG = logging.getLogger(__name__)
+
+
 N_HEX_LINE = (0, 1, 0)
 S_HEX_LINE = (0, 1, -conf.tile_height)
 NW_HEX_LINE = (conf.tile_point_slope, 1, 2 - conf.horz_point_width)
@@ -196,18 +202,6 @@ def get_topleft_tile_point(i, j):
     return x, y
 
 
-def shade_color(color, shader):
-    shader_alpha = shader[3]
-    r = lerp(color[0], shader[0], shader_alpha)
-    g = lerp(color[1], shader[1], shader_alpha)
-    b = lerp(color[2], shader[2], shader_alpha)
-    return (int(r), int(g), int(b), 255)
-
-
-def lerp(a, b, r):
-    return a + r * (b-a)
-
-
 def print_progress_bar (iteration, total, prefix = '', suffix = '', decimals = 1, length = 70, fill = u'\u2588'):
     """
     Call in a loop to create terminal progress bar
@@ -380,12 +374,13 @@ class FeatureGenerator(object):
 
 class FrameGenerator(object):
 
-    def __init__(self, color_map, perlin_generators, width, height, z):
+    def __init__(self, color_map, perlin_generators, width, height, z, precision="float"):
         self.color_map = list(color_map)
         self.perlin_generators = perlin_generators
         self.image = None
         self.z = z
-        self.point_list = SortedList()
+        self.precision = precision
+        self.values = None
         self.width = width
         self.height = height
         self.pixels_calculated = 0
@@ -402,26 +397,80 @@ class FrameGenerator(object):
                 args = (perlin_x, perlin_y, self.z)
             v = generator.get_value(*args)
             value += v * generator.weight
-        self.point_list.add((value, (x, y)))
         self.pixels_calculated += 1
+        return value
 
     def find_values(self):
+        values = self.find_row_values(0, self.height)
+        if values is not None:
+            self.add_values(0, values)
+
+    def find_row_values(self, y_start, y_stop):
+        if self.precision == "decimal":
+            return self.find_decimal_values(y_start, y_stop)
+        return self.find_float_values(y_start, y_stop)
+
+    def find_decimal_values(self, y_start, y_stop):
+        values = numpy.empty((self.width, y_stop - y_start), dtype=object)
         for i in range(self.width):
-            for j in range(self.height):
+            for j in range(y_start, y_stop):
                 if self.error:
-                    return
-                self.find_value(i, j)
+                    return None
+                values[i, j - y_start] = self.find_value(i, j)
+        return values
+
+    def find_float_values(self, y_start, y_stop):
+        perlin_x, perlin_y = numpy.meshgrid(
+            numpy.arange(self.width) / float(self.width),
+            numpy.arange(y_start, y_stop) / float(self.height),
+            indexing="ij",
+        )
+        values = numpy.zeros(perlin_x.shape)
+        for generator in self.perlin_generators:
+            if self.error:
+                return None
+            args = (perlin_x, perlin_y)
+            if len(generator.dimensions) == 3:
+                args = (perlin_x, perlin_y, float(self.z))
+            values += generator.get_values(*args) * float(generator.weight)
+        self.pixels_calculated += values.size
+        return values
+
+    def add_values(self, y_start, values):
+        if self.values is None:
+            self.values = numpy.empty((self.width, self.height), dtype=values.dtype)
+        self.values[:, y_start:y_start + values.shape[1]] = values
+
+    def get_color_bounds(self):
+        """
+        Number of pixels, counted from the highest value down, that end each color of the
+        color map. A color ends on the first pixel that takes the running share of pixels past
+        its threshold, and at most one color ends per pixel.
+        """
+        bounds = []
+        threshhold = 0
+        for new_threshhold, _ in reversed(self.color_map[1:]):
+            threshhold += new_threshhold
+            bound = int(threshhold * self.total_pixels) + 1
+            if bounds:
+                bound = max(bound, bounds[-1] + 1)
+            bounds.append(min(bound, int(self.total_pixels)))
+        bounds.append(int(self.total_pixels))
+        return bounds
 
     def draw_image(self):
-        self.image = Image.new('RGB', (self.width, self.height))
+        # Highest value first, ties broken by the highest (x, y), as in a reversed sort of
+        # (value, (x, y)) pairs
+        order = numpy.argsort(self.values.ravel(), kind="mergesort")[::-1]
+        color_indices = numpy.empty(order.size, dtype=numpy.intp)
+        start = 0
+        for color_index, stop in enumerate(self.get_color_bounds()):
+            color_indices[order[start:stop]] = color_index
+            start = stop
+        palette = numpy.array([color for _, color in reversed(self.color_map)], dtype=numpy.uint8)
+        colors = palette[color_indices].reshape(self.width, self.height, 3)
+        self.image = Image.fromarray(colors.transpose(1, 0, 2).copy(), "RGB")
         self.pixels = self.image.load()
-        threshhold, color = self.color_map.pop()
-        for i in range(len(self.point_list)):
-            x, y = self.point_list[-(i+1)][1]
-            self.pixels[x, y] = color
-            if (i+1) / self.total_pixels > threshhold:
-                new_threshhold, color = self.color_map.pop()
-                threshhold += new_threshhold
 
     def get_frame(self):
         if not self.image:
@@ -442,7 +491,42 @@ class BaseGenerator(object):
             setattr(self, key, value)
 
 
+WORKER_STATE = {}
+
+
+def init_frame_worker(progress_counter, perlin_generators):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Frame threads always started from a fresh decimal context, only the gradient vectors were
+    # made with decimal_precision, so do the same here to reproduce their values
+    setcontext(Context())
+    WORKER_STATE["progress_counter"] = progress_counter
+    WORKER_STATE["perlin_generators"] = perlin_generators
+
+
+class TerrainGeneratorError(Exception):
+    pass
+
+
+def find_frame_rows(framenum, z, precision, y_start, y_stop):
+    try:
+        frame_generator = FrameGenerator(
+            z=z, perlin_generators=WORKER_STATE["perlin_generators"], color_map=[],
+            width=conf.frame_width, height=conf.frame_height, precision=precision,
+        )
+        values = frame_generator.find_row_values(y_start, y_stop)
+        progress_counter = WORKER_STATE["progress_counter"]
+        with progress_counter.get_lock():
+            progress_counter.value += values.size
+        return framenum, y_start, values, None
+    except Exception:
+        return framenum, y_start, None, traceback.format_exc()
+
+
 class TerrainGenerator(BaseGenerator):
+    perlin_precision = "float"
+    backend = "process"
+    worker_count = None
+    rows_per_task = 6
     decimal_precision = 5
     animation_frame_count = 1
     animation_duration = 0
@@ -452,25 +536,33 @@ class TerrainGenerator(BaseGenerator):
 
     def __init__(self, **kwargs):
         super(TerrainGenerator, self).__init__(**kwargs)
-        getcontext().prec = self.decimal_precision
+        if self.perlin_precision == "decimal":
+            getcontext().prec = self.decimal_precision
         self.perlin_generators = []
         for spec in self.perlin_setup:
-            generator = TileablePerlinGenerator(**spec)
+            generator = TileablePerlinGenerator(precision=self.perlin_precision, **spec)
             self.perlin_generators.append(generator)
         self.pixel_count = conf.frame_pixel_count * self.animation_frame_count
         self.animation_duration = Decimal(self.animation_duration)
         self.frame_duration = self.animation_duration / self.animation_frame_count
         self.error = None
         self.frame_generators = []
+        self.pool = None
 
     def start(self):
         try:
             signal.signal(signal.SIGINT, self.handle_sigint)
             self.create_dir()
             self.make_border_map()
+            self.make_hex_shading()
             self.make_images()
             self.make_animations()
             self.wait_for_finish()
+            self.raise_error()
+            if self.pool:
+                self.pool.join()
+                # The callbacks of the last bands draw and save their frames until the join
+                self.raise_error()
         except Exception as e:
             self.error = e
             raise
@@ -478,6 +570,14 @@ class TerrainGenerator(BaseGenerator):
             if self.error:
                 for generator in self.frame_generators:
                     generator.error = self.error
+                if self.pool:
+                    self.pool.terminate()
+
+    def raise_error(self):
+        if self.error:
+            raise TerrainGeneratorError(
+                "Generating {} failed: {}".format(self.group_name, self.error)
+            )
 
     def make_border_map(self):
         self.border_map = {}
@@ -510,17 +610,92 @@ class TerrainGenerator(BaseGenerator):
                 self.border_map[(x, y)] = value
         return self.border_map.get((x, y))
 
+    def make_hex_shading(self):
+        """
+        Precompute, in image (y, x) layout, which tile pixels are inside the hex and the
+        border color and alpha blended over each of them, so cut_hex is just array operations.
+        """
+        shape = (conf.tile_height, conf.tile_width)
+        self.hex_mask = numpy.zeros(shape, dtype=bool)
+        self.hex_shade_color = numpy.zeros(shape + (3,))
+        self.hex_shade_alpha = numpy.zeros(shape)
+        for x in range(conf.tile_width):
+            for y in range(conf.tile_height):
+                if not is_in_hex(x, y):
+                    continue
+                self.hex_mask[y, x] = True
+                border_level = self.get_border_level(x, y)
+                if border_level < len(self.border):
+                    border_color = self.border[border_level]
+                    if len(border_color) == 2:
+                        border_color = border_color[y*2 / conf.tile_height > 0 and 1 or 0]
+                    self.hex_shade_color[y, x] = border_color[:3]
+                    self.hex_shade_alpha[y, x] = border_color[3]
+
     def create_dir(self):
         self.imgdir = os.path.join(self.outdir, self.group_name)
         use_dir(self.imgdir)
 
     def make_images(self):
+        if self.backend == "process":
+            self.make_images_in_pool()
+        elif self.backend == "thread":
+            self.make_images_in_threads()
+        else:
+            raise ValueError("Unknown terrain generator backend '{}'".format(self.backend))
+
+    def make_images_in_threads(self):
         self.threads = []
         for framenum in range(self.animation_frame_count):
             thread = Thread(target=self.try_make_frame, args=(framenum,))
             self.threads.append(thread)
             thread.start()
 
+    def make_images_in_pool(self):
+        """
+        Split every frame into bands of rows_per_task pixel rows and compute the bands in a
+        process pool. Workers add to a shared counter for wait_for_finish, and each frame is
+        drawn and cut into hexes here once all of its bands have come back.
+        """
+        self.progress_counter = Value("l", 0)
+        self.pool = Pool(
+            processes=self.worker_count or cpu_count(), initializer=init_frame_worker,
+            initargs=(self.progress_counter, self.perlin_generators),
+        )
+        self.rows_remaining = {}
+        for framenum in range(self.animation_frame_count):
+            frame_generator = self.make_frame_generator(framenum)
+            self.frame_generators.append(frame_generator)
+            self.rows_remaining[framenum] = conf.frame_height
+            for y_start in range(0, conf.frame_height, self.rows_per_task):
+                y_stop = min(y_start + self.rows_per_task, conf.frame_height)
+                self.pool.apply_async(
+                    find_frame_rows,
+                    (framenum, frame_generator.z, self.perlin_precision, y_start, y_stop),
+                    callback=self.receive_frame_rows,
+                )
+        self.pool.close()
+
+    def receive_frame_rows(self, result):
+        framenum, y_start, values, error = result
+        if self.error:
+            return
+        if error:
+            self.error = error
+            LOG.error("Terrain frame worker failed:\n%s", error)
+            return
+        try:
+            frame_generator = self.frame_generators[framenum]
+            frame_generator.add_values(y_start, values)
+            self.rows_remaining[framenum] -= values.shape[1]
+            if not self.rows_remaining[framenum]:
+                frame_generator.draw_image()
+                self.save_frame(framenum, frame_generator.image)
+        except Exception:
+            # Raising here would end the pool's result handler thread, so start reports it
+            self.error = traceback.format_exc()
+            LOG.error("Drawing terrain frame %s failed:\n%s", framenum, self.error)
+
     def threads_running(self):
         return sum([thread.isAlive() for thread in self.threads])
 
@@ -552,46 +727,43 @@ class TerrainGenerator(BaseGenerator):
             self.error = e
             raise
 
-    def make_frame(self, framenum):
+    def make_frame_generator(self, framenum):
         z = Decimal(framenum) / self.animation_frame_count
-        frame_generator = FrameGenerator(
+        return FrameGenerator(
             z=z, perlin_generators=self.perlin_generators, color_map=self.color_map,
-            width=conf.frame_width, height=conf.frame_height,
+            width=conf.frame_width, height=conf.frame_height, precision=self.perlin_precision,
         )
+
+    def make_frame(self, framenum):
+        frame_generator = self.make_frame_generator(framenum)
         self.frame_generators.append(frame_generator)
-        frame_image, frame_pixels = frame_generator.get_frame()
-        self.make_hexes(framenum, frame_pixels)
+        frame_image, _ = frame_generator.get_frame()
+        self.save_frame(framenum, frame_image)
+
+    def save_frame(self, framenum, frame_image):
+        self.make_hexes(framenum, numpy.asarray(frame_image))
         frame_image.save(os.path.join(self.imgdir, "{}_{}.png".format(self.group_name, framenum)))
 
-    def make_hexes(self, framenum, frame_pixels):
+    def make_hexes(self, framenum, frame):
         hexnum = 0
         for i in range(conf.frame_tile_count_horz):
             for j in range(conf.frame_tile_count_vert):
                 x, y = get_topleft_tile_point(i, j)
-                hex_img = self.cut_hex(frame_pixels, x, y)
+                hex_img = self.cut_hex(frame, x, y)
                 self.save_hex(hex_img, framenum, hexnum)
                 hexnum += 1
 
-    def cut_hex(self, frame_pixels, topleft_x, topleft_y):
-        hex_img = Image.new('RGBA', (conf.tile_width, conf.tile_height))
-        hex_pixels = hex_img.load()
-        for x in range(conf.tile_width):
-            for y in range(conf.tile_height):
-                if is_in_hex(x, y):
-                    frame_x = (x + topleft_x) % conf.frame_width
-                    frame_y = (y + topleft_y) % conf.frame_height
-                    color = frame_pixels[frame_x, frame_y]
-                    border_level = self.get_border_level(x, y)
-                    if border_level < len(self.border):
-                        border_color = self.border[border_level]
-                        if len(border_color) == 2:
-                            border_color = border_color[y*2 / conf.tile_height > 0 and 1 or 0]
-                        color = shade_color(color, border_color)
-                else:
-                    color = (0, 0, 0, 0)
-                hex_pixels[x, y] = color
-        return hex_img
-
+    def cut_hex(self, frame, topleft_x, topleft_y):
+        rows = numpy.arange(topleft_y, topleft_y + conf.tile_height)
+        columns = numpy.arange(topleft_x, topleft_x + conf.tile_width)
+        color = frame.take(rows, axis=0, mode="wrap").take(columns, axis=1, mode="wrap")
+        alpha = self.hex_shade_alpha[..., numpy.newaxis]
+        shaded = color + alpha * (self.hex_shade_color - color)
+        hex_pixels = numpy.zeros((conf.tile_height, conf.tile_width, 4), dtype=numpy.uint8)
+        hex_pixels[..., :3] = shaded.astype(numpy.uint8)
+        hex_pixels[..., 3] = 255
+        hex_pixels[~self.hex_mask] = 0
+        return Image.fromarray(hex_pixels, "RGBA")
 
     def save_hex(self, hex_img, framenum, hexnum):
         filename = "{}.png".format(self.get_hex_name(framenum, hexnum))
@@ -606,9 +778,14 @@ class TerrainGenerator(BaseGenerator):
     def handle_sigint(self, signal, frame):
         self.error = "SIGINT"
 
+    def get_pixels_calculated(self):
+        if self.pool:
+            return self.progress_counter.value
+        return sum([x.pixels_calculated for x in self.frame_generators])
+
     def wait_for_finish(self):
         pixel_sum = 0
         while not self.error and pixel_sum < self.pixel_count:
             time.sleep(self.progress_bar_sleep)
-            pixel_sum = sum([x.pixels_calculated for x in self.frame_generators])
+            pixel_sum = self.get_pixels_calculated()
             print_progress_bar(pixel_sum, self.pixel_count)